@@ -0,0 +1,91 @@
+import logging
+from decimal import Decimal, InvalidOperation
+from boto3.dynamodb.conditions import Key
+
+logger = logging.getLogger()
+
+# Outstanding is positive when the counterparty owes the user and negative
+# when the user owes the counterparty. Repayments reduce it in either case.
+LENT_POSITIONS = {"lent", "lend", "lender", "creditor"}
+BORROWED_POSITIONS = {"borrowed", "borrow", "borrower", "debtor"}
+REPAYMENT_ACTIONS = {"repay", "repayment", "payment", "pay", "settle", "return"}
+
+
+def to_decimal(value):
+    if value is None or value == "":
+        return Decimal(0)
+    try:
+        return Decimal(str(value))
+    except InvalidOperation:
+        logger.warning("Ignoring non-numeric amount: %s", value)
+        return Decimal(0)
+
+
+def balance_id(counterparty, currency):
+    return f"{counterparty}#{currency}"
+
+
+def balance_deltas(item, sign=1):
+    """Maps (counterparty, currency) to [outstanding delta, event count delta]
+    for one loan event. `sign=-1` gives the reverse delta."""
+    if not item or not item.get("counterparty"):
+        return {}
+
+    position = str(item.get("position") or "").strip().lower()
+    action = str(item.get("action") or "").strip().lower()
+    if position in LENT_POSITIONS:
+        direction = 1
+    elif position in BORROWED_POSITIONS:
+        direction = -1
+    else:
+        logger.warning("Unknown loan position '%s', outstanding balance not updated", position)
+        return {}
+    if action in REPAYMENT_ACTIONS:
+        direction = -direction
+
+    key = (item["counterparty"], item.get("currency") or "")
+    return {key: [sign * direction * to_decimal(item.get("amount")), sign]}
+
+
+def merge_deltas(*delta_maps):
+    merged = {}
+    for deltas in delta_maps:
+        for key, (amount, count) in deltas.items():
+            entry = merged.setdefault(key, [Decimal(0), 0])
+            entry[0] += amount
+            entry[1] += count
+    return {key: value for key, value in merged.items() if value[0] or value[1]}
+
+
+def apply_change(balances_table, user_id, old_item=None, new_item=None):
+    """Applies the outstanding-balance delta for a loan event changing from
+    `old_item` to `new_item`. Either side may be None for inserts and deletes."""
+    deltas = merge_deltas(balance_deltas(old_item, sign=-1), balance_deltas(new_item))
+    for (counterparty, currency), (amount, count) in deltas.items():
+        balances_table.update_item(
+            Key={
+                "userId": user_id,
+                "balanceId": balance_id(counterparty, currency)
+            },
+            UpdateExpression="SET counterparty = :counterparty, currency = :currency ADD outstanding :amount, events :count",
+            ExpressionAttributeValues={
+                ":counterparty": counterparty,
+                ":currency": currency,
+                ":amount": amount,
+                ":count": count
+            }
+        )
+
+
+def get_balances(balances_table, user_id):
+    response = balances_table.query(KeyConditionExpression=Key("userId").eq(user_id))
+    result = response["Items"]
+
+    while "LastEvaluatedKey" in response:
+        response = balances_table.query(
+            ExclusiveStartKey=response["LastEvaluatedKey"],
+            KeyConditionExpression=Key("userId").eq(user_id)
+        )
+        result.extend(response["Items"])
+
+    return [item for item in result if item.get("events")]
@@ -1,15 +1,34 @@
-import boto3
-import json
+import balances
 import logging
-from custom_encoder import CustomEncoder
-from decimal import Decimal
+from common import versions
+from common.apigateway import build_response
+from common.log import log_event
+from common.pagination import decode_cursor, encode_cursor, parse_limit, read_page
+from common.projection import parse_fields, projection
+from common.router import Router
+from common.runtime import lazy_table, mark_invocation
+from common.updates import apply_update, build_update, split_fields
+from boto3.dynamodb.conditions import Attr
 
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
 
 dynamodbTableName = "Loans"
-dynamodb = boto3.resource("dynamodb")
-table = dynamodb.Table(dynamodbTableName)
+table = lazy_table(dynamodbTableName)
+balancesTableName = "LoanBalances"
+balances_table = lazy_table(balancesTableName)
+
+# Attributes a client may ask for with ?fields=; the keys are always returned.
+KEY_FIELDS = ("loanId", "userId")
+FIELDS = {
+    "tdate", "ddate", "type", "counterparty", "position", "action", "amount", "currency", "fee",
+    "fromWallet", "toWallet", "note"
+}
+# A PATCH with an empty string removes these; other fields keep their value.
+CLEARABLE_FIELDS = {"fromWallet", "toWallet", "ddate", "note"}
+
+# GET /loans returns one page of at most `limit` loans and a nextCursor.
+DEFAULT_PAGE_LIMIT = 100
+MAX_PAGE_LIMIT = 1000
 
 GET_METHOD = "GET"
 POST_METHOD = "POST"
@@ -18,86 +37,87 @@ DELETE_METHOD = "DELETE"
 HEALTH_PATH = "/healthC"
 LOAN_PATH = "/loan"
 LOANS_PATH = "/loans"
+SUMMARY_PATH = "/loans/summary"
 
-def lambda_handler(event, context):
-    logger.info(f"Received event: {event}")    
-    http_method = event["httpMethod"]
-    _path = event.get("path", "")
-    _stage = (event.get("requestContext") or {}).get("stage")
-    if _stage and _path.startswith("/" + _stage + "/"):
-        _path = _path[len(_stage) + 1:]
-    elif _stage and _path == "/" + _stage:
-        _path = "/"
-    path = event.get("resource") or _path
-    
-    try:
-        if http_method == GET_METHOD and path == HEALTH_PATH:
-            response = build_response(200, {"status": "Healthy"})
-            
-        elif http_method == GET_METHOD and path == LOAN_PATH:
-            query_params = event.get("queryStringParameters", {})
-            loan_id = query_params.get("loanId")
-            user_id = query_params.get("userId")
-
-            if not loan_id or not user_id:
-                response = build_response(400, {"Message": "loanId and userId are required"})
-            else:
-                response = get_loan(loan_id, user_id)
-            
-        elif http_method == GET_METHOD and path == LOANS_PATH:
-            response = get_loans()
-            
-        elif http_method == POST_METHOD and path == LOAN_PATH:
-            response = save_loan(json.loads(event["body"]))
-   
-        elif http_method == PATCH_METHOD and path == LOAN_PATH:
-            request_body = json.loads(event["body"])
-            loan_id = request_body.get("loanId")
-            user_id = request_body.get("userId")
-            loan_type = request_body.get("type")  
-            counterparty = request_body.get("counterparty")
-            tdate = request_body.get("tdate")
-            ddate = request_body.get("ddate")
-            position = request_body.get("position")
-            from_wallet = request_body.get("fromWallet")
-            to_wallet = request_body.get("toWallet")
-            action = request_body.get("action")
-            amount = request_body.get("amount")
-            currency = request_body.get("currency")
-            fee = request_body.get("fee")
-            note = request_body.get("note")
-
-            if not loan_id or not user_id:
-                response = build_response(400, {"Message": "Missing required fields for updating loan"})
-            else:
-                response = modify_loan(loan_id, user_id, loan_type, counterparty, tdate, ddate, position, from_wallet, to_wallet, action, amount, currency, fee, note)
-        
-        elif http_method == DELETE_METHOD and path == LOAN_PATH:
-            request_body = json.loads(event["body"])
-            loan_id = request_body.get("loanId")
-            user_id = request_body.get("userId")
-            
-            if not loan_id or not user_id:
-                response = build_response(400, {"Message": "loanId and userId are required"})
-            else:
-                response = delete_loan(loan_id, user_id)
-        
-        else:
-            response = build_response(404, {"Message": "Path not found"})
-    except Exception as e:
-        logger.exception("Error processing request")
-        return build_response(500, {"Message": f"Internal server error: {str(e)}"})
-    return response
+router = Router()
 
-def get_loan(loan_id, user_id):
+def lambda_handler(event, context):
+    log_event(logger, event, context)
+    mark_invocation()
+    return router.dispatch(event, context)
+
+@router.route(GET_METHOD, HEALTH_PATH)
+def handle_health(request):
+    return build_response(200, {"status": "Healthy"})
+
+@router.route(GET_METHOD, LOAN_PATH)
+def handle_get_loan(request):
+    loan_id = request.query.get("loanId")
+    user_id = request.query.get("userId")
+
+    if not loan_id or not user_id:
+        return build_response(400, {"Message": "loanId and userId are required"})
+    return get_loan(loan_id, user_id, parse_fields(request, FIELDS, KEY_FIELDS))
+
+@router.route(GET_METHOD, LOANS_PATH)
+def handle_get_loans(request):
+    # Without userId every loan is listed, as before; with it the list is
+    # scoped to the user and supports conditional requests.
+    user_id = request.query.get("userId")
+    cursor = request.query.get("cursor")
+    limit = parse_limit(request.query.get("limit"), DEFAULT_PAGE_LIMIT, MAX_PAGE_LIMIT)
+
+    if limit is None:
+        return build_response(400, {"Message": f"limit must be between 1 and {MAX_PAGE_LIMIT}"})
+    fields = parse_fields(request, FIELDS, KEY_FIELDS)
+    if not user_id:
+        return get_loans(limit=limit, cursor=cursor, fields=fields)
+    etag, not_modified = versions.conditional_get(request, user_id, versions.LOANS)
+    if not_modified:
+        return not_modified
+    return get_loans(user_id, limit, cursor, etag, fields)
+
+@router.route(GET_METHOD, SUMMARY_PATH)
+def handle_get_summary(request):
+    user_id = request.query.get("userId")
+
+    if not user_id:
+        return build_response(400, {"Message": "Missing required parameter: userId"})
+    return get_summary(user_id)
+
+@router.route(POST_METHOD, LOAN_PATH)
+def handle_save_loan(request):
+    return save_loan(request.body)
+
+@router.route(PATCH_METHOD, LOAN_PATH)
+def handle_modify_loan(request):
+    body = request.body
+    loan_id = body.get("loanId")
+    user_id = body.get("userId")
+
+    if not loan_id or not user_id:
+        return build_response(400, {"Message": "Missing required fields for updating loan"})
+    return modify_loan(loan_id, user_id, {k: v for k, v in body.items() if k in FIELDS})
+
+@router.route(DELETE_METHOD, LOAN_PATH)
+def handle_delete_loan(request):
+    loan_id = request.body.get("loanId")
+    user_id = request.body.get("userId")
+
+    if not loan_id or not user_id:
+        return build_response(400, {"Message": "loanId and userId are required"})
+    return delete_loan(loan_id, user_id)
+
+def get_loan(loan_id, user_id, fields=None):
     try:
-        logger.info(f"Fetching loan with Key: {{'loanId': {loan_id}, 'userId': '{user_id}'}}")
+        logger.info("Fetching loan with Key: %s", {"loanId": loan_id, "userId": user_id})
 
         response = table.get_item(
             Key={
                 "loanId": loan_id,
                 "userId": user_id
-            }
+            },
+            **projection(fields)
         )
 
         if "Item" in response:
@@ -108,23 +128,46 @@ def get_loan(loan_id, user_id):
         logger.exception("Error retrieving loan")
         return build_response(500, {"Message": "Error retrieving loan"})
 
-def get_loans():
+def get_loans(user_id=None, limit=DEFAULT_PAGE_LIMIT, cursor=None, etag=None, fields=None):
     try:
-        response = table.scan()
-        result = response["Items"]
+        start_key = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        return build_response(400, {"Message": "Invalid cursor"})
 
-        while "LastEvaluatedKey" in response:
-            response = table.scan(ExclusiveStartKey=response["LastEvaluatedKey"])
-            result.extend(response["Items"])
-
-        return build_response(200, {"loans": result})
+    try:
+        scan_kwargs = projection(fields)
+        if user_id:
+            scan_kwargs["FilterExpression"] = Attr("userId").eq(user_id)
+        items, last_key = read_page(table.scan, limit, start_key, **scan_kwargs)
+        return build_response(200, {
+            "loans": items,
+            "nextCursor": encode_cursor(last_key) if last_key else None
+        }, etag=etag)
     except Exception as e:
         logger.exception("Error retrieving loans")
         return build_response(500, {"Message": "Error retrieving loans"})
 
+def get_summary(user_id):
+    try:
+        result = balances.get_balances(balances_table, user_id)
+        return build_response(200, {"balances": result})
+    except Exception as e:
+        logger.exception("Error retrieving loan summary")
+        return build_response(500, {"Message": "Error retrieving loan summary"})
+
+def update_balances(user_id, old_item, new_item):
+    # The loan write has already succeeded; a failed balance update is
+    # logged rather than turned into an error for the client.
+    try:
+        balances.apply_change(balances_table, user_id, old_item, new_item)
+    except Exception as e:
+        logger.exception("Error updating outstanding balances for userId: %s", user_id)
+
 def save_loan(request_body):
     try:
-        table.put_item(Item=request_body)
+        response = table.put_item(Item=request_body, ReturnValues="ALL_OLD")
+        update_balances(request_body.get("userId"), response.get("Attributes"), request_body)
+        versions.bump(request_body.get("userId"), versions.LOANS)
         return build_response(200, {
             "Operation": "SAVE",
             "Message": "SUCCESS",
@@ -134,87 +177,22 @@ def save_loan(request_body):
         logger.exception("Error saving loan")
         return build_response(500, {"Message": "Error saving loan"})
 
-def modify_loan(loan_id, user_id, loan_type, counterparty, tdate, ddate, position, from_wallet, to_wallet, action, amount, currency, fee, note):
+def modify_loan(loan_id, user_id, fields):
     try:
-        # Fields that can be cleared (set to empty) by the user
-        clearable_fields = {"fromWallet", "toWallet", "ddate", "note"}
-
-        all_fields = {
-            "type": loan_type,
-            "counterparty": counterparty,
-            "tdate": tdate,
-            "ddate": ddate,
-            "position": position,
-            "fromWallet": from_wallet,
-            "toWallet": to_wallet,
-            "action": action,
-            "amount": amount,
-            "currency": currency,
-            "fee": fee,
-            "note": note,
-        }
-
-        set_fields = {}
-        remove_fields = []
-
-        for key, value in all_fields.items():
-            if isinstance(value, str) and value.strip() == "":
-                if key in clearable_fields:
-                    remove_fields.append(key)
-                # else: skip non-clearable empty fields (keep old value)
-            elif value is not None:
-                set_fields[key] = value
-
+        set_fields, remove_fields = split_fields(fields, CLEARABLE_FIELDS)
         if not set_fields and not remove_fields:
             return build_response(400, {"Message": "No fields to update"})
 
-        reserved_keywords = {"type", "action", "position"}
-        expression_attribute_names = {}
-        expression_attribute_values = {}
-        expression_parts = []
-
-        if set_fields:
-            set_clauses = []
-            for key, value in set_fields.items():
-                name_key = f"#{key}" if key in reserved_keywords else key
-                value_key = f":{key}"
-                set_clauses.append(f"{name_key} = {value_key}")
-                if name_key.startswith("#"):
-                    expression_attribute_names[name_key] = key
-                expression_attribute_values[value_key] = value
-            expression_parts.append("SET " + ", ".join(set_clauses))
-
-        if remove_fields:
-            remove_clauses = []
-            for key in remove_fields:
-                name_key = f"#{key}" if key in reserved_keywords else key
-                remove_clauses.append(name_key)
-                if name_key.startswith("#"):
-                    expression_attribute_names[name_key] = key
-            expression_parts.append("REMOVE " + ", ".join(remove_clauses))
-
-        update_expression = " ".join(expression_parts)
-
-        update_kwargs = {
-            "Key": {
-                "loanId": loan_id,
-                "userId": user_id
-            },
-            "UpdateExpression": update_expression,
-            "ExpressionAttributeValues": expression_attribute_values,
-            "ReturnValues": "UPDATED_NEW"
-        }
-        if expression_attribute_names:
-            update_kwargs["ExpressionAttributeNames"] = expression_attribute_names
-        # If only REMOVE (no SET), ExpressionAttributeValues will be empty — omit it
-        if not expression_attribute_values:
-            del update_kwargs["ExpressionAttributeValues"]
-
-        response = table.update_item(**update_kwargs)
+        key = {"loanId": loan_id, "userId": user_id}
+        response = table.update_item(Key=key, ReturnValues="ALL_OLD", **build_update(set_fields, remove_fields))
+        old_item = response.get("Attributes")
+        update_balances(user_id, old_item, apply_update(old_item, key, set_fields, remove_fields))
+        versions.bump(user_id, versions.LOANS)
+
         return build_response(200, {
             "Operation": "UPDATE",
             "Message": "SUCCESS",
-            "UpdatedAttributes": response["Attributes"]
+            "UpdatedAttributes": set_fields
         })
     except Exception as e:
         logger.exception("Error updating loan")
@@ -231,6 +209,8 @@ def delete_loan(loan_id, user_id):
             ReturnValues="ALL_OLD"
         )
         if "Attributes" in response:
+            update_balances(user_id, response["Attributes"], None)
+            versions.bump(user_id, versions.LOANS)
             return build_response(200, {
                 "Operation": "DELETE",
                 "Message": "SUCCESS",
@@ -241,16 +221,3 @@ def delete_loan(loan_id, user_id):
     except Exception as e:
         logger.exception("Error deleting loan")
         return build_response(500, {"Message": "Error deleting loan"})
-
-
-def build_response(status_code, body=None):
-    response = {
-        "statusCode": status_code,
-        "headers": {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": "*"
-        }
-    }
-    if body is not None:
-        response["body"] = json.dumps(body, cls=CustomEncoder)
-    return response
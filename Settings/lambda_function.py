@@ -1,16 +1,18 @@
-import boto3
-import json
 import logging
-from custom_encoder import CustomEncoder
-from decimal import Decimal
-from boto3.dynamodb.conditions import Attr
+import os
+from common import metrics
+from common.apigateway import build_response
+from common.cache import MISSING, TTLCache
+from common.log import log_event
+from common.projection import parse_fields, project
+from common.router import Router
+from common.runtime import lazy_table, mark_invocation
+from common.updates import build_update
 
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
 
 dynamodbTableName = "Settings"
-dynamodb = boto3.resource("dynamodb")
-table = dynamodb.Table(dynamodbTableName)
+table = lazy_table(dynamodbTableName)
 
 GET_METHOD = "GET"
 POST_METHOD = "POST"
@@ -21,63 +23,62 @@ SET_PATH = "/settings"
 
 ALLOWED_FIELDS = {"currency", "theme", "incomeCategories", "expenseCategories", "dashboardColors"}
 
+# Settings are read on every page load and change rarely. Warm containers
+# serve them from memory; a write through another container becomes
+# visible here after at most the TTL. Misses read consistently, so a row
+# cached for the TTL is never one a just-finished write has replaced, and
+# a PATCH refills this container's entry from the item it wrote.
+settings_cache = TTLCache(
+    maxsize=int(os.environ.get("SETTINGS_CACHE_MAX_ENTRIES", "256")),
+    ttl=float(os.environ.get("SETTINGS_CACHE_TTL_SECONDS", "60"))
+)
+
+
+router = Router()
+
 
 def lambda_handler(event, context):
-    logger.info(f"Received event: {event}")
-    http_method = event["httpMethod"]
-    _path = event.get("path", "")
-    _stage = (event.get("requestContext") or {}).get("stage")
-    if _stage and _path.startswith("/" + _stage + "/"):
-        _path = _path[len(_stage) + 1:]
-    elif _stage and _path == "/" + _stage:
-        _path = "/"
-    path = event.get("resource") or _path
+    log_event(logger, event, context)
+    mark_invocation()
+    return router.dispatch(event, context)
 
-    try:
-        if http_method == GET_METHOD and path == HEALTH_PATH:
-            response = build_response(200, {"status": "Healthy"})
 
-        elif http_method == GET_METHOD and path == SET_PATH:
-            query_params = event.get("queryStringParameters", {})
-            user_id = query_params.get("userId")
+@router.route(GET_METHOD, HEALTH_PATH)
+def handle_health(request):
+    return build_response(200, {"status": "Healthy", "settingsCache": settings_cache.stats()})
 
-            if not user_id:
-                response = build_response(400, {"Message": "userId are required"})
-            else:
-                response = get_settings(user_id)
 
-        elif http_method == PATCH_METHOD and path == SET_PATH:
-            request_body = json.loads(event["body"])
-            user_id = request_body.get("userId")
+@router.route(GET_METHOD, SET_PATH)
+def handle_get_settings(request):
+    user_id = request.query.get("userId")
 
-            if not user_id:
-                response = build_response(400, {"Message": "Missing required fields for updating settings"})
-            else:
-                response = modify_setting(user_id, request_body)
+    if not user_id:
+        return build_response(400, {"Message": "userId are required"})
+    return get_settings(user_id, parse_fields(request, ALLOWED_FIELDS, ("userId",)))
 
-        else:
-            response = build_response(404, {"Message": "Path not found"})
-    except Exception as e:
-        logger.exception("Error processing request")
-        return build_response(500, {"Message": f"Internal server error: {str(e)}"})
-    return response
 
+@router.route(PATCH_METHOD, SET_PATH)
+def handle_modify_setting(request):
+    user_id = request.body.get("userId")
 
-def get_settings(user_id):
-    try:
-        response = table.scan(
-            FilterExpression=Attr('userId').eq(user_id)
-        )
-        result = response["Items"]
+    if not user_id:
+        return build_response(400, {"Message": "Missing required fields for updating settings"})
+    return modify_setting(user_id, request.body)
 
-        while "LastEvaluatedKey" in response:
-            response = table.scan(
-                ExclusiveStartKey=response["LastEvaluatedKey"],
-                FilterExpression=Attr('userId').eq(user_id)
-            )
-            result.extend(response["Items"])
 
-        return build_response(200, {"settings": result})
+def get_settings(user_id, fields=None):
+    try:
+        item = settings_cache.get(user_id)
+        if item is MISSING:
+            metrics.count("SettingsCacheMiss")
+            item = table.get_item(Key={"userId": user_id}, ConsistentRead=True).get("Item")
+            settings_cache.set(user_id, item)
+        else:
+            metrics.count("SettingsCacheHit")
+
+        # The cache holds whole items, so fields= is applied in memory here.
+        item = project(item, fields)
+        return build_response(200, {"settings": [item] if item else []})
     except Exception as e:
         logger.exception("Error retrieving settings")
         return build_response(500, {"Message": "Error retrieving settings"})
@@ -89,42 +90,18 @@ def modify_setting(user_id, fields):
         if not updates:
             return build_response(400, {"Message": "No valid fields to update"})
 
-        set_clauses = []
-        expr_names = {}
-        expr_values = {}
-
-        for i, (field, value) in enumerate(updates.items()):
-            name_key = f"#f{i}"
-            value_key = f":v{i}"
-            set_clauses.append(f"{name_key} = {value_key}")
-            expr_names[name_key] = field
-            expr_values[value_key] = value
-
         response = table.update_item(
             Key={"userId": user_id},
-            UpdateExpression="SET " + ", ".join(set_clauses),
-            ExpressionAttributeNames=expr_names,
-            ExpressionAttributeValues=expr_values,
-            ReturnValues="UPDATED_NEW"
+            ReturnValues="ALL_NEW",
+            **build_update(updates)
         )
+        item = response["Attributes"]
+        settings_cache.set(user_id, item)
         return build_response(200, {
             "Operation": "UPDATE",
             "Message": "SUCCESS",
-            "UpdatedAttributes": response["Attributes"]
+            "UpdatedAttributes": {k: item[k] for k in updates if k in item}
         })
     except Exception as e:
         logger.exception("Error updating setting")
         return build_response(500, {"Message": "Error updating setting"})
-
-
-def build_response(status_code, body=None):
-    response = {
-        "statusCode": status_code,
-        "headers": {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": "*"
-        }
-    }
-    if body is not None:
-        response["body"] = json.dumps(body, cls=CustomEncoder)
-    return response
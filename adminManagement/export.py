@@ -0,0 +1,243 @@
+import csv
+import gzip
+import hashlib
+import io
+import logging
+import os
+import re
+from datetime import datetime, timezone
+from decimal import Decimal
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.exceptions import ClientError
+from common import encoder
+from common.batching import batch_get_items
+from common.parallel_scan import parallel_scan
+from tables import ENTITY_TABLES, is_missing_index_error
+
+logger = logging.getLogger()
+
+# Streams one user's rows out of every entity table into one gzip file per
+# entity. Items go from each DynamoDB page straight through the compressor
+# to the sink, so memory is bounded by a page plus one upload part no
+# matter how much data the user has.
+PAGE_SIZE = 500
+PART_SIZE = 8 * 1024 * 1024
+# Segments for the filtered scan used when a table lacks its userId-index.
+SCAN_SEGMENTS = 8
+# userIds used as-is in export paths; anything else is hashed.
+SAFE_ID = re.compile(r"[A-Za-z0-9_-]{1,128}")
+
+
+def iter_user_items(table, spec, user_id, dynamodb, scan_segments=SCAN_SEGMENTS):
+    """Yields the user's items from one table: a query on its userId
+    partition, or a page of keys from its userId-index GSI followed by a
+    BatchGetItem for the full rows. A table without the index falls back
+    to a parallel filtered scan."""
+    if spec.partitioned:
+        kwargs = {"KeyConditionExpression": Key("userId").eq(user_id), "Limit": PAGE_SIZE}
+        while True:
+            response = table.query(**kwargs)
+            yield from response["Items"]
+            if "LastEvaluatedKey" not in response:
+                return
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    kwargs = {"IndexName": spec.index_name, "KeyConditionExpression": Key("userId").eq(user_id), "Limit": PAGE_SIZE}
+    try:
+        response = table.query(**kwargs)
+    except ClientError as e:
+        if not is_missing_index_error(e):
+            raise
+        logger.warning("Index %s not found on %s, falling back to a parallel scan", spec.index_name, spec.table_name)
+        yield from parallel_scan(table, scan_segments, FilterExpression=Attr("userId").eq(user_id))
+        return
+
+    while True:
+        keys = [{field: item[field] for field in spec.key_fields} for item in response["Items"]]
+        if keys:
+            yield from batch_get_items(dynamodb, spec.table_name, keys)
+        if "LastEvaluatedKey" not in response:
+            return
+        response = table.query(ExclusiveStartKey=response["LastEvaluatedKey"], **kwargs)
+
+
+def path_component(user_id):
+    """`user_id` as a single, safe path segment. Ids outside SAFE_ID (such
+    as "../x") are replaced by a hash, so they cannot leave the export
+    directory or prefix."""
+    user_id = str(user_id)
+    if SAFE_ID.fullmatch(user_id):
+        return user_id
+    return "u-" + hashlib.sha256(user_id.encode()).hexdigest()[:32]
+
+
+class NdjsonWriter:
+    extension = "ndjson"
+
+    def __init__(self, stream, spec):
+        self.stream = stream
+
+    def write(self, item):
+        self.stream.write(encoder.dumps(item))
+        self.stream.write("\n")
+
+
+class CsvWriter:
+    """Writes the entity's known columns in a fixed order, so the header is
+    known before the first row; any other attributes go into a trailing
+    JSON "extra" column."""
+    extension = "csv"
+
+    def __init__(self, stream, spec):
+        self.columns = spec.columns
+        self.known = set(spec.columns)
+        self.writer = csv.writer(stream)
+        self.writer.writerow(list(self.columns) + ["extra"])
+
+    def write(self, item):
+        row = [csv_value(item.get(column)) for column in self.columns]
+        extra = {key: value for key, value in item.items() if key not in self.known}
+        row.append(encoder.dumps(extra) if extra else "")
+        self.writer.writerow(row)
+
+
+WRITERS = {"ndjson": NdjsonWriter, "csv": CsvWriter}
+
+
+def csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, Decimal):
+        # str() keeps every stored digit; money is never rounded on export.
+        return str(value)
+    if isinstance(value, (dict, list, set)):
+        return encoder.dumps(value)
+    return value
+
+
+class LocalDirectorySink:
+    def __init__(self, directory):
+        self.directory = directory
+
+    def open(self, name):
+        path = self.location(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return open(path, "wb")
+
+    def location(self, name):
+        root = os.path.realpath(self.directory)
+        path = os.path.realpath(os.path.join(root, name))
+        if os.path.commonpath([root, path]) != root:
+            raise ValueError(f"Export path escapes {self.directory}: {name}")
+        return path
+
+
+class S3Sink:
+    def __init__(self, client, bucket, prefix="", part_size=PART_SIZE):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.part_size = part_size
+
+    def open(self, name):
+        return MultipartUpload(self.client, self.bucket, self.prefix + name, self.part_size)
+
+    def location(self, name):
+        return f"s3://{self.bucket}/{self.prefix}{name}"
+
+
+class MultipartUpload(io.RawIOBase):
+    """Write-only stream to one S3 object. Data is sent in `part_size`
+    parts as it is written; an object smaller than one part is sent with a
+    single put_object. Leaving the block with an exception aborts the
+    upload, or skips the put_object, instead of writing a truncated
+    object."""
+
+    def __init__(self, client, bucket, key, part_size=PART_SIZE):
+        super().__init__()
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.buffer = bytearray()
+        self.upload_id = None
+        self.parts = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= self.part_size:
+            self._upload_part(bytes(self.buffer[:self.part_size]))
+            del self.buffer[:self.part_size]
+        return len(data)
+
+    def _upload_part(self, body):
+        if self.upload_id is None:
+            self.upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=self.key)["UploadId"]
+        number = len(self.parts) + 1
+        response = self.client.upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, PartNumber=number, Body=body
+        )
+        self.parts.append({"PartNumber": number, "ETag": response["ETag"]})
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self.upload_id is None:
+                self.client.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self.buffer))
+            else:
+                if self.buffer:
+                    self._upload_part(bytes(self.buffer))
+                self.client.complete_multipart_upload(
+                    Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                    MultipartUpload={"Parts": self.parts}
+                )
+        finally:
+            self.buffer = bytearray()
+            super().close()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            if self.upload_id is not None:
+                self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+                self.upload_id = None
+            self.buffer = bytearray()
+            super().close()
+            return False
+        return super().__exit__(exc_type, exc, tb)
+
+
+def export_table(table, spec, user_id, sink, name, fmt="ndjson", dynamodb=None):
+    rows = 0
+    with sink.open(name) as raw, gzip.GzipFile(fileobj=raw, mode="wb") as compressed, \
+            io.TextIOWrapper(compressed, encoding="utf-8", newline="") as text:
+        writer = WRITERS[fmt](text, spec)
+        for item in iter_user_items(table, spec, user_id, dynamodb):
+            writer.write(item)
+            rows += 1
+    return rows
+
+
+def export_user(user_id, get_table, sink, fmt="ndjson", tables=ENTITY_TABLES, dynamodb=None):
+    """Exports every entity table for `user_id` to `sink` as
+    <userId>/<timestamp>/<Table>.<fmt>.gz plus a manifest.json, and returns
+    the manifest. `dynamodb` is the boto3 resource used for BatchGetItem."""
+    if fmt not in WRITERS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+
+    exported_at = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    base = f"{path_component(user_id)}/{exported_at}/"
+    manifest = {"userId": user_id, "format": fmt, "exportedAt": exported_at, "files": []}
+    for spec in tables:
+        name = f"{base}{spec.table_name}.{WRITERS[fmt].extension}.gz"
+        rows = export_table(get_table(spec.table_name), spec, user_id, sink, name, fmt, dynamodb)
+        logger.info("Exported %d %s rows for userId %s", rows, spec.table_name, user_id)
+        manifest["files"].append({"table": spec.table_name, "location": sink.location(name), "rows": rows})
+
+    with sink.open(base + "manifest.json") as raw:
+        raw.write(encoder.dumps(manifest).encode())
+    manifest["location"] = sink.location(base + "manifest.json")
+    return manifest
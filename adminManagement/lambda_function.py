@@ -0,0 +1,107 @@
+import export
+import logging
+import os
+import purge
+import time
+from common import versions
+from common.log import set_request_context
+from common.runtime import get_client, get_resource, lazy_table, mark_invocation
+
+logger = logging.getLogger()
+
+# Admin-only function, invoked directly (console, CLI or a Step Functions
+# loop) rather than through API Gateway:
+#
+#   {"action": "purge", "userId": "...", "checkpoint": null}
+#   {"action": "export", "userId": "...", "format": "ndjson" | "csv"}
+#
+# There is no default action: a purge is destructive and must be asked for.
+# A purge stops before the invocation times out and returns its checkpoint
+# with status IN_PROGRESS; invoking again with that checkpoint resumes it.
+# Exports go to EXPORT_BUCKET when it is set, otherwise under EXPORT_DIR.
+PURGE_MAX_WORKERS = int(os.environ.get("PURGE_MAX_WORKERS", "8"))
+PURGE_MAX_WRITE_CAPACITY = float(os.environ.get("PURGE_MAX_WRITE_CAPACITY", "0")) or None
+# Time left for the last pages to finish deleting and the result to return.
+TIME_MARGIN_MS = int(os.environ.get("TIME_MARGIN_MS", "15000"))
+EXPORT_BUCKET = os.environ.get("EXPORT_BUCKET")
+EXPORT_PREFIX = os.environ.get("EXPORT_PREFIX", "exports/")
+EXPORT_DIR = os.environ.get("EXPORT_DIR", "/tmp/exports")
+
+tables = {}
+
+
+def get_table(name):
+    if name not in tables:
+        tables[name] = lazy_table(name)
+    return tables[name]
+
+
+def lambda_handler(event, context):
+    set_request_context(event, context)
+    logger.info("Received admin %s request for userId %s", event.get("action"), event.get("userId"))
+    mark_invocation()
+
+    action = event.get("action")
+    if action == "purge":
+        return purge_user(event, context)
+    if action == "export":
+        return export_user(event)
+    if not action:
+        return {"status": "FAILED", "Message": "action is required"}
+    return {"status": "FAILED", "Message": f"Unknown action: {action}"}
+
+
+def deadline_for(context):
+    if context is None or not hasattr(context, "get_remaining_time_in_millis"):
+        return None
+    return time.monotonic() + (context.get_remaining_time_in_millis() - TIME_MARGIN_MS) / 1000
+
+
+def purge_user(event, context):
+    user_id = event.get("userId")
+    if not user_id:
+        return {"status": "FAILED", "Message": "userId is required"}
+
+    try:
+        result = purge.purge_user(
+            user_id,
+            get_table,
+            checkpoint=event.get("checkpoint"),
+            deadline=deadline_for(context),
+            max_workers=PURGE_MAX_WORKERS,
+            max_write_capacity=PURGE_MAX_WRITE_CAPACITY
+        )
+    except ValueError as e:
+        return {"status": "FAILED", "Message": str(e)}
+
+    # UserVersions is left in place: bumping rather than deleting the
+    # counters keeps ETags cached by clients from matching recreated data.
+    versions.bump(user_id, *versions.COLLECTIONS)
+    logger.info("Purge for userId %s is %s: %s", user_id, result["status"], result["deleted"])
+    return result
+
+
+def export_sink():
+    if EXPORT_BUCKET:
+        return export.S3Sink(get_client("s3"), EXPORT_BUCKET, EXPORT_PREFIX)
+    return export.LocalDirectorySink(EXPORT_DIR)
+
+
+def export_user(event):
+    user_id = event.get("userId")
+    if not user_id:
+        return {"status": "FAILED", "Message": "userId is required"}
+
+    try:
+        manifest = export.export_user(
+            user_id,
+            get_table,
+            export_sink(),
+            fmt=event.get("format", "ndjson"),
+            dynamodb=get_resource()
+        )
+    except ValueError as e:
+        return {"status": "FAILED", "Message": str(e)}
+
+    logger.info("Export for userId %s written to %s", user_id, manifest["location"])
+    return {"status": "COMPLETE", **manifest}
@@ -0,0 +1,100 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+from common.capacity import CapacityLimiter
+from tables import USER_TABLES, is_missing_index_error
+
+logger = logging.getLogger()
+
+PAGE_SIZE = 500
+
+
+def read_keys(table, target, user_id, state):
+    """One page of the user's keys: from the table's own userId partition,
+    or from its userId-index GSI, which holds every row and only keys."""
+    kwargs = {"KeyConditionExpression": Key("userId").eq(user_id), "Limit": PAGE_SIZE}
+    if target.index_name:
+        kwargs["IndexName"] = target.index_name
+    else:
+        projection = {f"#k{i}": field for i, field in enumerate(target.key_fields)}
+        kwargs["ProjectionExpression"] = ", ".join(projection)
+        kwargs["ExpressionAttributeNames"] = projection
+    if state.get("lastKey"):
+        kwargs["ExclusiveStartKey"] = state["lastKey"]
+
+    response = table.query(**kwargs)
+    keys = [{field: item[field] for field in target.key_fields} for item in response["Items"]]
+    return keys, response.get("LastEvaluatedKey")
+
+
+def purge_table(table, target, user_id, state, deadline, limiter=None):
+    """Deletes the user's rows from one table page by page until they are
+    exhausted or `deadline` (a time.monotonic() value) passes. `state` is
+    updated after every page so it can be stored as a checkpoint and
+    resumed."""
+    state.setdefault("deleted", 0)
+    state.pop("error", None)
+
+    while not state.get("done"):
+        if deadline is not None and time.monotonic() >= deadline:
+            return state
+        keys, last_key = read_keys(table, target, user_id, state)
+        if keys:
+            with table.batch_writer(overwrite_by_pkeys=list(target.key_fields)) as writer:
+                for key in keys:
+                    if limiter:
+                        limiter.wait()
+                        limiter.consume(1)
+                    writer.delete_item(Key=key)
+        state["deleted"] += len(keys)
+        state["lastKey"] = last_key
+        state["done"] = last_key is None
+        if keys:
+            logger.info("Purged %d items from %s (%d so far)", len(keys), target.table_name, state["deleted"])
+    return state
+
+
+def purge_user(user_id, get_table, checkpoint=None, deadline=None, max_workers=8,
+               max_write_capacity=None, targets=USER_TABLES):
+    """Deletes every item `user_id` owns across `targets`, one table per
+    worker, all concurrently. Returns a checkpoint; pass it back in to
+    resume when its status is not COMPLETE. `max_write_capacity` caps
+    deletes per second for each table."""
+    checkpoint = checkpoint or {"userId": user_id, "tables": {}}
+    if checkpoint.get("userId") != user_id:
+        raise ValueError("Checkpoint belongs to a different userId")
+
+    units = {target.table_name: target for target in targets}
+
+    def run(table_name):
+        target = units[table_name]
+        state = checkpoint["tables"].setdefault(table_name, {})
+        limiter = CapacityLimiter(max_write_capacity) if max_write_capacity else None
+        try:
+            purge_table(get_table(table_name), target, user_id, state, deadline, limiter)
+        except ClientError as e:
+            if target.index_name and is_missing_index_error(e):
+                logger.error("Index %s not found on %s; cannot purge it", target.index_name, table_name)
+                state["error"] = f"Index {target.index_name} not found on {table_name}"
+            else:
+                logger.exception("Error purging %s for userId: %s", table_name, user_id)
+                state["error"] = str(e)
+        except Exception as e:
+            logger.exception("Error purging %s for userId: %s", table_name, user_id)
+            state["error"] = str(e)
+
+    pending = [name for name in units if not checkpoint["tables"].get(name, {}).get("done")]
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pending) or 1))) as executor:
+        list(executor.map(run, pending))
+
+    states = checkpoint["tables"].values()
+    if any("error" in state for state in states):
+        checkpoint["status"] = "FAILED"
+    elif all(checkpoint["tables"].get(name, {}).get("done") for name in units):
+        checkpoint["status"] = "COMPLETE"
+    else:
+        checkpoint["status"] = "IN_PROGRESS"
+    checkpoint["deleted"] = {name: state.get("deleted", 0) for name, state in checkpoint["tables"].items()}
+    return checkpoint
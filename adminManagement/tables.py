@@ -0,0 +1,64 @@
+# Every entity table without a userId partition has a userId-index GSI:
+# partition key userId, KEYS_ONLY projection. Unlike the userId-tdate GSIs
+# it is not sparse, so it lists every row a user owns, including rows
+# written before tdate was required.
+USER_INDEX_NAME = "userId-index"
+
+
+class UserTable:
+    """Where a user's rows live in one table and how to find them: a query
+    on the table's own userId partition, or on its userId-index GSI.
+    `columns` is the CSV column order for entity tables; attributes outside
+    it are exported in a trailing JSON column."""
+
+    def __init__(self, table_name, key_fields, partitioned=False, columns=None, entity=True):
+        self.table_name = table_name
+        self.key_fields = key_fields
+        self.partitioned = partitioned
+        self.columns = columns or key_fields
+        self.entity = entity
+
+    @property
+    def index_name(self):
+        return None if self.partitioned else USER_INDEX_NAME
+
+
+def is_missing_index_error(error):
+    err = error.response.get("Error", {})
+    return err.get("Code") == "ValidationException" and "index" in err.get("Message", "").lower()
+
+
+ENTITY_TABLES = [
+    UserTable("Transactions", ("transId", "userId"), columns=(
+        "transId", "userId", "tdate", "transType", "mainCat", "amount", "currency", "fee",
+        "fromWallet", "toWallet", "note"
+    )),
+    UserTable("Cryptos", ("cryptoId", "userId"), columns=(
+        "cryptoId", "userId", "tdate", "cryptoName", "operation", "quantity", "price", "currency",
+        "fee", "feeCurrency", "fromWallet", "toWallet", "note"
+    )),
+    UserTable("Stocks", ("stockId", "userId"), columns=(
+        "stockId", "userId", "tdate", "stockName", "side", "quantity", "price", "currency",
+        "fee", "feeCurrency", "fromWallet", "toWallet", "note"
+    )),
+    UserTable("Wallets", ("walletId", "userId"), columns=(
+        "walletId", "userId", "walletName", "walletType", "accountNumber", "balance", "currency",
+        "color", "note"
+    )),
+    UserTable("Loans", ("loanId", "userId"), columns=(
+        "loanId", "userId", "tdate", "ddate", "type", "counterparty", "position", "action", "amount",
+        "currency", "fee", "fromWallet", "toWallet", "note"
+    )),
+    UserTable("Settings", ("userId",), partitioned=True),
+]
+
+# Aggregates maintained from the entity tables; purged with the account
+# but not exported, since they can be rebuilt.
+DERIVED_TABLES = [
+    UserTable("CryptoHoldings", ("userId", "holdingId"), partitioned=True, entity=False),
+    UserTable("TransactionSummaries", ("userId", "month"), partitioned=True, entity=False),
+    UserTable("LoanBalances", ("userId", "balanceId"), partitioned=True, entity=False),
+]
+
+USER_TABLES = ENTITY_TABLES + DERIVED_TABLES
+
@@ -0,0 +1,162 @@
+"""Cold-start benchmark for every Lambda function in the repo.
+
+Each run starts a fresh interpreter (like a new Lambda container), imports
+the function's lambda_function module (the init phase) and serves one
+DynamoDB-backed list route. DynamoDB is a local stub endpoint that answers
+every call with an empty result, so the timings cover Python and boto3
+work only, not the network. Creating the boto3 resource lands in the init
+phase when it is built at import time and in the first request when it is
+built lazily; init + first request is the cold start a client waits for.
+
+With --baseline REF the same probes also run against the tree at that git
+ref (e.g. the commit before common.runtime), side by side.
+
+Against the tree before common.runtime (boto3 1.43, 5-9 runs) the init
+phase is 90-170 ms shorter and the first data request about as much
+longer, so a data route's cold start is unchanged within noise (about
+350-450 ms either way). Only health checks and routes that never touch
+DynamoDB start faster.
+
+    python benchmarks/cold_start.py [--runs N] [--baseline REF]
+
+The stub is reached through AWS_ENDPOINT_URL_DYNAMODB, which needs
+boto3/botocore 1.28 or later.
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Function directory -> list route served on the first request.
+FUNCTIONS = {
+    "walletManagement": "/wallets",
+    "transManagement": "/transactions",
+    "cryptoManagement": "/cryptos",
+    "stockManagement": "/stocks",
+    "LoanManagement": "/loans",
+    "Settings": "/settings",
+}
+
+# Empty answers in DynamoDB's JSON protocol, by X-Amz-Target operation.
+STUB_RESPONSES = {
+    "GetItem": {},
+    "Query": {"Items": [], "Count": 0, "ScannedCount": 0},
+    "Scan": {"Items": [], "Count": 0, "ScannedCount": 0},
+    "UpdateItem": {},
+}
+
+PROBE = """
+import json, sys, time
+sys.path[:0] = [{function_dir!r}, {root!r}]
+started = time.perf_counter()
+import lambda_function
+imported = time.perf_counter()
+response = lambda_function.lambda_handler({event!r}, None)
+invoked = time.perf_counter()
+print(json.dumps({{
+    "initMs": (imported - started) * 1000,
+    "firstRequestMs": (invoked - imported) * 1000,
+    "statusCode": response["statusCode"]
+}}))
+"""
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        operation = (self.headers.get("X-Amz-Target") or "").rpartition(".")[2]
+        body = json.dumps(STUB_RESPONSES.get(operation, {})).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-amz-json-1.0")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def extract_tree(ref, directory):
+    """Writes the tree at git `ref` into `directory` and returns it."""
+    archive = subprocess.run(["git", "-C", ROOT, "archive", ref], capture_output=True, check=True).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(directory)
+    return directory
+
+
+def measure(root, function, path, endpoint):
+    event = {
+        "httpMethod": "GET",
+        "path": path,
+        "resource": path,
+        "requestContext": {},
+        "queryStringParameters": {"userId": "bench-user"},
+    }
+    code = PROBE.format(function_dir=os.path.join(root, function), root=root, event=event)
+    env = dict(os.environ)
+    env.update({
+        "AWS_DEFAULT_REGION": env.get("AWS_DEFAULT_REGION", "eu-north-1"),
+        "AWS_ACCESS_KEY_ID": "bench",
+        "AWS_SECRET_ACCESS_KEY": "bench",
+        "AWS_ENDPOINT_URL_DYNAMODB": endpoint,
+        "METRICS_ENABLED": "false",
+        "LOG_LEVEL": "WARNING",
+    })
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True, env=env
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarize(root, function, path, endpoint, runs):
+    samples = [measure(root, function, path, endpoint) for _ in range(runs)]
+    init_ms = statistics.median(s["initMs"] for s in samples)
+    request_ms = statistics.median(s["firstRequestMs"] for s in samples)
+    return init_ms, request_ms, samples[-1]["statusCode"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--baseline", help="git ref to compare against, e.g. the commit before common.runtime")
+    args = parser.parse_args()
+
+    server = start_stub()
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}"
+    with tempfile.TemporaryDirectory() as directory:
+        trees = [("change", ROOT)]
+        if args.baseline:
+            trees.insert(0, ("baseline", extract_tree(args.baseline, directory)))
+
+        print(f"{'function':<18} {'tree':<9} {'init ms':>8} {'1st req ms':>11} {'total ms':>9} {'status':>7}")
+        for function, path in FUNCTIONS.items():
+            for label, root in trees:
+                init_ms, request_ms, status = summarize(root, function, path, endpoint, args.runs)
+                print(
+                    f"{function:<18} {label:<9} {init_ms:>8.1f} {request_ms:>11.1f} "
+                    f"{init_ms + request_ms:>9.1f} {status:>7}"
+                )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except BrokenPipeError:
+        # Output piped into e.g. head, which exited early.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
@@ -0,0 +1,67 @@
+"""Micro-benchmark of response compression: CPU time against bytes saved.
+
+Encodes Transactions and Cryptos list payloads of several sizes with
+common.encoder.dumps, then times common.apigateway.compress for gzip at a
+few levels and brotli at a few qualities (when installed). Sizes are the
+base64 body API Gateway receives, next to the plain JSON body.
+
+    python benchmarks/compression_bench.py [--items N [N ...]] [--repeat R]
+"""
+import argparse
+import base64
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# EMF lines would swamp the output and their cost the timings;
+# METRICS_ENABLED=true in the environment still turns them on.
+os.environ.setdefault("METRICS_ENABLED", "false")
+
+from common import apigateway, encoder  # noqa: E402
+from encoder_bench import cryptos, transactions  # noqa: E402
+
+GZIP_LEVELS = (1, 6, 9)
+BROTLI_QUALITIES = (1, 4, 8)
+
+
+def settings():
+    for level in GZIP_LEVELS:
+        yield f"gzip-{level}", "gzip", ("GZIP_LEVEL", level)
+    if apigateway.brotli is not None:
+        for quality in BROTLI_QUALITIES:
+            yield f"br-{quality}", "br", ("BROTLI_QUALITY", quality)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if apigateway.brotli is None:
+        print("brotli not installed, gzip only")
+    print(f"{'payload':<20} {'setting':<8} {'json bytes':>11} {'body bytes':>11} {'saved':>7} {'ms':>8} {'KB saved/ms':>12}")
+    for count in args.items:
+        rng = random.Random(42)
+        for name, payload in (("Transactions", transactions(count, rng)), ("Cryptos", cryptos(count, rng))):
+            data = encoder.dumps(payload).encode()
+            label = f"{name} x{count}"
+            for setting, encoding, (option, value) in settings():
+                setattr(apigateway, option, value)
+                elapsed = min(timeit.repeat(lambda: apigateway.compress(data, encoding), number=1, repeat=args.repeat))
+                size = len(base64.b64encode(apigateway.compress(data, encoding)))
+                saved = len(data) - size
+                print(
+                    f"{label:<20} {setting:<8} {len(data):>11} {size:>11} {saved / len(data):>6.0%} "
+                    f"{elapsed * 1000:>8.2f} {saved / 1024 / (elapsed * 1000):>12.1f}"
+                )
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except BrokenPipeError:
+        # Output piped into e.g. head, which exited early.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
@@ -0,0 +1,92 @@
+"""Micro-benchmark of response encoding for large list payloads.
+
+Builds 10k-item Transactions and Cryptos payloads shaped like boto3 returns
+them (numbers as Decimal) and times json.dumps with CustomEncoder against
+common.encoder.dumps.
+
+    python benchmarks/encoder_bench.py [--items N] [--repeat R]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# EMF lines would swamp the output and their cost the timings;
+# METRICS_ENABLED=true in the environment still turns them on.
+os.environ.setdefault("METRICS_ENABLED", "false")
+
+from common import encoder  # noqa: E402
+
+
+def money(rng, low, high):
+    return Decimal(f"{rng.uniform(low, high):.2f}")
+
+
+def transactions(count, rng):
+    return {"transactions": [
+        {
+            "transId": f"t-{i:08d}",
+            "userId": "user-1",
+            "transType": rng.choice(["Expense", "Income", "Transfer"]),
+            "mainCat": rng.choice(["Food", "Rent", "Salary", "Travel", "Bills"]),
+            "tdate": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "amount": money(rng, 1, 2500),
+            "fromWallet": "w-1",
+            "toWallet": "w-2",
+            "currency": "EUR",
+            "fee": money(rng, 0, 3),
+            "note": "card payment"
+        }
+        for i in range(count)
+    ]}
+
+
+def cryptos(count, rng):
+    return {"cryptos": [
+        {
+            "cryptoId": f"c-{i:08d}",
+            "userId": "user-1",
+            "cryptoName": rng.choice(["BTC", "ETH", "SOL"]),
+            "tdate": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "operation": rng.choice(["Buy", "Sell", "Transfer"]),
+            "quantity": Decimal(f"{rng.uniform(0, 3):.8f}"),
+            "price": money(rng, 10, 70000),
+            "currency": "USD",
+            "fee": money(rng, 0, 10),
+            "feeCurrency": "USD",
+            "fromWallet": "w-1",
+            "toWallet": "w-3",
+            "note": ""
+        }
+        for i in range(count)
+    ]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    payloads = {"Transactions": transactions(args.items, rng), "Cryptos": cryptos(args.items, rng)}
+
+    print(f"encoder backend: {encoder.encoder_backend()}")
+    print(f"{'payload':<14} {'CustomEncoder ms':>17} {'dumps ms':>10} {'speedup':>8} {'bytes':>10}")
+    for name, payload in payloads.items():
+        legacy = min(timeit.repeat(lambda: json.dumps(payload, cls=encoder.CustomEncoder), number=1, repeat=args.repeat))
+        fast = min(timeit.repeat(lambda: encoder.dumps(payload), number=1, repeat=args.repeat))
+        size = len(encoder.dumps(payload))
+        print(f"{name:<14} {legacy * 1000:>17.1f} {fast * 1000:>10.1f} {legacy / fast:>7.2f}x {size:>10}")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except BrokenPipeError:
+        # Output piped into e.g. head, which exited early.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
@@ -0,0 +1,3 @@
+# Code shared by every Lambda function in this repo. It is deployed as a
+# Lambda layer (python/common/...), so each function imports it as
+# `common.<module>` next to its own lambda_function.py.
@@ -0,0 +1,127 @@
+import base64
+import gzip
+import os
+import time
+
+from common import encoder, metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Opt-in: with RESPONSE_COMPRESSION=true, responses are compressed when the
+# client sends Accept-Encoding and the JSON body is at least
+# COMPRESSION_MIN_BYTES; below that the header and CPU time outweigh the
+# bytes saved. Compressed bodies are returned base64 encoded with
+# isBase64Encoded, which API Gateway only decodes when the API lists */*
+# (or the response Content-Type) under binary media types, so enable it
+# only once the stage is configured that way.
+#
+#   RESPONSE_COMPRESSION   "true" turns compression on (default off)
+#   COMPRESSION_MIN_BYTES  smallest body to compress (default 1024)
+#   GZIP_LEVEL             1-9 (default 6)
+#   BROTLI_QUALITY         0-11 (default 4); brotli is used only when installed
+COMPRESSION_ENABLED = os.environ.get("RESPONSE_COMPRESSION", "false").lower() == "true"
+COMPRESSION_MIN_BYTES = int(os.environ.get("COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", "4"))
+
+
+def resolve_path(event):
+    # API Gateway sends the resource template when it matched one; the raw
+    # path still carries the stage prefix (e.g. /PROD/wallets).
+    path = event.get("path", "")
+    stage = (event.get("requestContext") or {}).get("stage")
+    if stage and path.startswith("/" + stage + "/"):
+        path = path[len(stage) + 1:]
+    elif stage and path == "/" + stage:
+        path = "/"
+    return event.get("resource") or path
+
+
+def build_response(status_code, body=None, etag=None):
+    response = {
+        "statusCode": status_code,
+        "headers": {
+            "Content-Type": "application/json",
+            "Access-Control-Allow-Origin": "*"
+        }
+    }
+    if etag:
+        response["headers"]["ETag"] = etag
+        response["headers"]["Access-Control-Expose-Headers"] = "ETag"
+    if body is not None:
+        started = time.perf_counter()
+        response["body"] = encoder.dumps(body)
+        metrics.record_encode((time.perf_counter() - started) * 1000)
+    return response
+
+
+def accepted_encodings(accept_encoding):
+    """Parses Accept-Encoding into {coding: q}."""
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def negotiate_encoding(accept_encoding):
+    """Returns "br", "gzip" or None. Brotli wins ties because it is smaller
+    at the same CPU cost, but only when the module is available."""
+    accepted = accepted_encodings(accept_encoding)
+    wildcard = accepted.get("*", 0.0)
+    candidates = ["br", "gzip"] if brotli is not None else ["gzip"]
+    best, best_q = None, 0.0
+    for coding in candidates:
+        q = accepted.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    # mtime=0 keeps the output stable for identical bodies.
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def compress_response(response, accept_encoding, min_bytes=None):
+    """Compresses the body of a build_response result in place when the
+    client accepts it and it pays off. Streamed and already-binary bodies
+    are left alone."""
+    body = response.get("body")
+    if not COMPRESSION_ENABLED or not isinstance(body, str) or response.get("isBase64Encoded"):
+        return response
+    headers = response.setdefault("headers", {})
+    headers["Vary"] = "Accept-Encoding"
+
+    data = body.encode()
+    if len(data) < (COMPRESSION_MIN_BYTES if min_bytes is None else min_bytes):
+        return response
+    encoding = negotiate_encoding(accept_encoding)
+    if encoding is None:
+        return response
+
+    started = time.perf_counter()
+    encoded = base64.b64encode(compress(data, encoding)).decode("ascii")
+    metrics.record_encode((time.perf_counter() - started) * 1000)
+    if len(encoded) >= len(data):
+        return response
+    response["body"] = encoded
+    response["isBase64Encoded"] = True
+    headers["Content-Encoding"] = encoding
+    return response
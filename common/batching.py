@@ -0,0 +1,47 @@
+import random
+import time
+
+# Request limits of the DynamoDB batch APIs and the retry policy shared by
+# every caller. Throttled or unprocessed requests back off exponentially
+# with jitter so concurrent Lambdas do not retry in lockstep.
+WRITE_CHUNK_SIZE = 25
+READ_CHUNK_SIZE = 100
+MAX_ATTEMPTS = 6
+BASE_BACKOFF_SECONDS = 0.05
+MAX_BACKOFF_SECONDS = 2.0
+
+RETRYABLE_ERRORS = {
+    "ProvisionedThroughputExceededException",
+    "ThrottlingException",
+    "RequestLimitExceeded",
+    "InternalServerError"
+}
+
+
+def chunked(entries, size):
+    for start in range(0, len(entries), size):
+        yield entries[start:start + size]
+
+
+def backoff(attempt, sleep=time.sleep):
+    sleep(min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * 2 ** attempt) * random.uniform(0.5, 1.0))
+
+
+def batch_get_items(dynamodb, table_name, keys, sleep=time.sleep, **options):
+    """Reads `keys` from `table_name` with BatchGetItem in 100-key chunks,
+    retrying UnprocessedKeys. `dynamodb` is the boto3 resource; `options`
+    (e.g. ProjectionExpression) apply to every chunk. Items come back in no
+    particular order, and keys must not repeat."""
+    items = []
+    for chunk in chunked(list(keys), READ_CHUNK_SIZE):
+        request = {table_name: {"Keys": chunk, **options}}
+        for attempt in range(MAX_ATTEMPTS):
+            response = dynamodb.batch_get_item(RequestItems=request)
+            items.extend(response.get("Responses", {}).get(table_name, []))
+            request = response.get("UnprocessedKeys") or {}
+            if not request:
+                break
+            backoff(attempt, sleep)
+        else:
+            raise RuntimeError(f"Could not read {len(request[table_name]['Keys'])} items from {table_name}")
+    return items
@@ -0,0 +1,42 @@
+import threading
+import time
+
+
+class CapacityLimiter:
+    """Token bucket over consumed capacity units.
+
+    DynamoDB only reports the capacity a request used after it returns, so
+    callers wait for a non-negative balance before each request and pay
+    the actual cost afterwards.
+    """
+
+    def __init__(self, units_per_second):
+        self.units_per_second = float(units_per_second)
+        self.available = self.units_per_second
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(
+            self.units_per_second,
+            self.available + (now - self.updated) * self.units_per_second
+        )
+        self.updated = now
+
+    def wait(self, stop_event=None):
+        while True:
+            with self.lock:
+                self._refill()
+                if self.available >= 0:
+                    return
+                delay = -self.available / self.units_per_second
+            if stop_event is not None and stop_event.wait(delay):
+                return
+            if stop_event is None:
+                time.sleep(delay)
+
+    def consume(self, units):
+        with self.lock:
+            self._refill()
+            self.available -= units
@@ -0,0 +1,59 @@
+import json
+from decimal import Decimal
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Every Decimal goes out as a JSON number, whatever the row or backend: the
+# nearest float, as the handlers have always sent them, except whole
+# numbers too large for a float to hold exactly (e.g. wei amounts), which
+# go out as exact integers. A float keeps 15-17 significant digits, as
+# much as a JavaScript client parses anyway, so an 18-decimal ETH quantity
+# is rounded to that.
+#
+# orjson is declared in common/requirements.txt for the layer build; the
+# stdlib fallback produces the same values.
+MAX_EXACT_FLOAT_INT = 2 ** 53
+
+
+class CustomEncoder(json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, Decimal):
+            return float(obj)
+
+        return json.JSONEncoder.default(self, obj)
+
+
+def decimal_to_number(value):
+    number = float(value)
+    if number.is_integer() and abs(number) >= MAX_EXACT_FLOAT_INT:
+        return int(value)
+    return number
+
+
+def _default(obj):
+    if type(obj) is Decimal:
+        return decimal_to_number(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(body):
+    # orjson first; the stdlib fallback only calls back into Python for the
+    # Decimal values themselves. orjson stops at integers wider than 64
+    # bits, so those bodies take the fallback too.
+    if orjson is not None:
+        try:
+            return orjson.dumps(body, default=_default).decode()
+        except orjson.JSONEncodeError:
+            pass
+    return json.dumps(body, default=_default, ensure_ascii=False, separators=(",", ":"))
+
+
+def encoder_backend():
+    if orjson is not None:
+        return "orjson"
+    return "json"
@@ -0,0 +1,139 @@
+import base64
+import json
+import logging
+import os
+import random
+import time
+
+# Structured logging for every function. Each line is one JSON object that
+# carries the Lambda and API Gateway request ids, so CloudWatch Logs
+# Insights can filter and correlate without parsing free text. Messages use
+# %-style arguments, which are only formatted when the level is enabled.
+#
+#   LOG_LEVEL              root level (default INFO)
+#   LOG_FORMAT             "json" (default) or "text"
+#   LOG_REDACT_FIELDS      comma-separated keys masked in logged events and fields
+#   LOG_EVENT_SAMPLE_RATE  share of requests (0.0-1.0) that also log the full,
+#                          redacted event (default 0)
+DEFAULT_REDACT_FIELDS = "authorization,cookie,set-cookie,x-api-key,x-amz-security-token,password,token,secret"
+REDACTED = "***"
+
+_request = {"requestId": None, "apiRequestId": None}
+_redact_fields = frozenset()
+_sample_rate = 0.0
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamps the current request ids onto every record."""
+
+    def filter(self, record):
+        record.requestId = _request["requestId"]
+        record.apiRequestId = _request["apiRequestId"]
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "message": record.getMessage(),
+            "requestId": getattr(record, "requestId", None),
+        }
+        api_request_id = getattr(record, "apiRequestId", None)
+        if api_request_id:
+            entry["apiRequestId"] = api_request_id
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(redact(fields))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, separators=(",", ":"))
+
+
+def configure():
+    """Applies the LOG_* settings to the root logger. The Lambda runtime
+    installs its own handler; its formatter is replaced rather than adding
+    a second handler, so lines are not written twice."""
+    global _redact_fields, _sample_rate
+    _redact_fields = frozenset(
+        name.strip().lower()
+        for name in os.environ.get("LOG_REDACT_FIELDS", DEFAULT_REDACT_FIELDS).split(",")
+        if name.strip()
+    )
+    try:
+        _sample_rate = min(max(float(os.environ.get("LOG_EVENT_SAMPLE_RATE", "0")), 0.0), 1.0)
+    except ValueError:
+        _sample_rate = 0.0
+
+    root = logging.getLogger()
+    root.setLevel(os.environ.get("LOG_LEVEL", "INFO").upper())
+    if not root.handlers:
+        root.addHandler(logging.StreamHandler())
+    for handler in root.handlers:
+        if not any(isinstance(f, RequestContextFilter) for f in handler.filters):
+            handler.addFilter(RequestContextFilter())
+        if os.environ.get("LOG_FORMAT", "json").lower() == "json":
+            handler.setFormatter(JsonFormatter())
+    return root
+
+
+def redact(value):
+    if isinstance(value, dict):
+        return {
+            key: REDACTED if str(key).lower() in _redact_fields else redact(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [redact(item) for item in value]
+    return value
+
+
+def set_request_context(event, context=None):
+    _request["requestId"] = getattr(context, "aws_request_id", None)
+    _request["apiRequestId"] = ((event or {}).get("requestContext") or {}).get("requestId")
+
+
+def log_event(logger, event, context=None):
+    """Logs a one-line summary of an API Gateway event. The full event is
+    only dumped, redacted, for a sampled share of requests or at DEBUG."""
+    set_request_context(event, context)
+    if not logger.isEnabledFor(logging.INFO):
+        return
+
+    body = event.get("body")
+    logger.info(
+        "Received %s %s",
+        event.get("httpMethod"),
+        event.get("path"),
+        extra={"fields": {
+            "httpMethod": event.get("httpMethod"),
+            "path": event.get("path"),
+            "resource": event.get("resource"),
+            "stage": (event.get("requestContext") or {}).get("stage"),
+            "bodyBytes": len(body) if body else 0,
+        }}
+    )
+
+    if logger.isEnabledFor(logging.DEBUG) or (_sample_rate and random.random() < _sample_rate):
+        logger.info("Sampled event", extra={"fields": {"event": redact_event(event)}})
+
+
+def redact_event(event):
+    event = dict(event)
+    body = event.get("body")
+    if body and event.get("isBase64Encoded"):
+        # Decoded so that secrets in the body are redacted like any other.
+        try:
+            body = base64.b64decode(body).decode("utf-8")
+        except (ValueError, UnicodeDecodeError):
+            body = None
+    if body:
+        try:
+            event["body"] = json.loads(body)
+        except ValueError:
+            pass
+    return redact(event)
+
+
+configure()
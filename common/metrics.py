@@ -0,0 +1,200 @@
+import json
+import os
+import sys
+import threading
+import time
+from functools import lru_cache
+
+# Per-request metrics in CloudWatch embedded metric format (EMF). While a
+# route is being served, every DynamoDB table call made through
+# common.runtime.LazyTable is timed and asks for ReturnConsumedCapacity, and
+# response encoding and compression are timed in common.apigateway. When
+# the route returns, one EMF line is written for the route and one per
+# (table, operation), so a slow call can be split into cold start, DynamoDB
+# and encoding time. A request's lines go to the sink in a single write.
+#
+#   METRICS_ENABLED    "false" turns recording and emission off
+#   METRICS_NAMESPACE  CloudWatch namespace (default FinanceApp)
+INSTRUMENTED_OPERATIONS = frozenset({"get_item", "query", "scan", "put_item", "update_item", "delete_item"})
+
+ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() != "false"
+NAMESPACE = os.environ.get("METRICS_NAMESPACE", "FinanceApp")
+SERVICE = os.environ.get("AWS_LAMBDA_FUNCTION_NAME", "local")
+
+_current = None
+_pending_init_ms = None
+
+
+_encode = json.JSONEncoder(separators=(",", ":")).encode
+
+
+def _print_sink(text):
+    # EMF lines must reach CloudWatch Logs as-is, not wrapped by the
+    # JSON log formatter, so they bypass logging.
+    sys.stdout.write(text + "\n")
+    sys.stdout.flush()
+
+
+_sink = _print_sink
+
+
+class ListSink:
+    """Collects emitted lines in memory, for tests and local runs."""
+
+    def __init__(self):
+        self.lines = []
+
+    def __call__(self, text):
+        self.lines.extend(text.split("\n"))
+
+    @property
+    def records(self):
+        return [json.loads(line) for line in self.lines]
+
+
+def set_sink(sink):
+    """Replaces where EMF lines are written; None restores stdout. A sink
+    is called once per request with its lines joined by newlines."""
+    global _sink
+    _sink = sink or _print_sink
+    return _sink
+
+
+class Recorder:
+    def __init__(self, route):
+        self.route = route
+        self.started = time.perf_counter()
+        self.operations = {}
+        self.encode_ms = 0.0
+        self.init_ms = None
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def add_call(self, table_name, operation, elapsed_ms, capacity):
+        # Parallel scans call in from worker threads.
+        with self._lock:
+            entry = self.operations.setdefault((table_name, operation), [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += elapsed_ms
+            entry[2] += capacity
+
+    def add_encode(self, elapsed_ms):
+        self.encode_ms += elapsed_ms
+
+
+def note_cold_start(init_ms):
+    """Called once per container; the next recorded route reports it."""
+    global _pending_init_ms
+    _pending_init_ms = init_ms
+
+
+def begin(route):
+    global _current, _pending_init_ms
+    if not ENABLED:
+        return None
+    _current = Recorder(route)
+    _current.init_ms, _pending_init_ms = _pending_init_ms, None
+    return _current
+
+
+def end(status_code=None, request_id=None):
+    global _current
+    recorder, _current = _current, None
+    if recorder is None:
+        return
+    latency_ms = (time.perf_counter() - recorder.started) * 1000
+    timestamp = int(time.time() * 1000)
+
+    dynamodb_calls = sum(entry[0] for entry in recorder.operations.values())
+    dynamodb_ms = sum(entry[1] for entry in recorder.operations.values())
+    capacity = sum(entry[2] for entry in recorder.operations.values())
+    values = {
+        "Latency": (latency_ms, "Milliseconds"),
+        "DynamoDBLatency": (dynamodb_ms, "Milliseconds"),
+        "DynamoDBCalls": (dynamodb_calls, "Count"),
+        "ConsumedCapacity": (capacity, "Count"),
+        "EncodeLatency": (recorder.encode_ms, "Milliseconds"),
+        "ColdStart": (1 if recorder.init_ms is not None else 0, "Count"),
+    }
+    if recorder.init_ms is not None:
+        values["InitDuration"] = (recorder.init_ms, "Milliseconds")
+    for name, value in recorder.counts.items():
+        values[name] = (value, "Count")
+    lines = [_line(timestamp, {"Service": SERVICE, "Route": recorder.route}, values, {
+        "statusCode": status_code,
+        "requestId": request_id
+    })]
+
+    for (table_name, operation), (calls, elapsed_ms, units) in recorder.operations.items():
+        lines.append(_line(
+            timestamp,
+            {"Service": SERVICE, "Route": recorder.route, "Table": table_name, "Operation": operation},
+            {
+                "DynamoDBLatency": (elapsed_ms, "Milliseconds"),
+                "DynamoDBCalls": (calls, "Count"),
+                "ConsumedCapacity": (units, "Count")
+            },
+            {"requestId": request_id}
+        ))
+    _sink("\n".join(lines))
+
+
+@lru_cache(maxsize=256)
+def _directive(dimension_names, metric_units):
+    """The CloudWatchMetrics part of an EMF line, serialized once per
+    combination of dimension and metric names."""
+    return _encode([{
+        "Namespace": NAMESPACE,
+        "Dimensions": [list(dimension_names)],
+        "Metrics": [{"Name": name, "Unit": unit} for name, unit in metric_units]
+    }])
+
+
+def _line(timestamp, dimensions, values, properties):
+    fields = dict(dimensions)
+    for name, (value, unit) in values.items():
+        fields[name] = round(value, 3) if isinstance(value, float) else value
+    fields.update(properties)
+    directive = _directive(tuple(dimensions), tuple((name, unit) for name, (value, unit) in values.items()))
+    return f'{{"_aws":{{"Timestamp":{timestamp},"CloudWatchMetrics":{directive}}},{_encode(fields)[1:]}'
+
+
+def record_encode(elapsed_ms):
+    recorder = _current
+    if recorder is not None:
+        recorder.add_encode(elapsed_ms)
+
+
+def count(name, value=1):
+    """Adds to a route-level Count metric, e.g. cache hits."""
+    recorder = _current
+    if recorder is not None:
+        recorder.counts[name] = recorder.counts.get(name, 0) + value
+
+
+def consumed_units(response):
+    consumed = response.get("ConsumedCapacity") if isinstance(response, dict) else None
+    if isinstance(consumed, list):
+        return sum(float(entry.get("CapacityUnits") or 0) for entry in consumed)
+    if consumed:
+        return float(consumed.get("CapacityUnits") or 0)
+    return 0.0
+
+
+def instrument(table_name, operation, method):
+    """Wraps a boto3 Table method so calls made while a route is being
+    recorded are timed and report their consumed capacity."""
+    def call(*args, **kwargs):
+        recorder = _current
+        if recorder is None:
+            return method(*args, **kwargs)
+        kwargs.setdefault("ReturnConsumedCapacity", "TOTAL")
+        started = time.perf_counter()
+        try:
+            response = method(*args, **kwargs)
+        except Exception:
+            recorder.add_call(table_name, operation, (time.perf_counter() - started) * 1000, 0.0)
+            raise
+        recorder.add_call(table_name, operation, (time.perf_counter() - started) * 1000, consumed_units(response))
+        return response
+    return call
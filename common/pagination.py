@@ -0,0 +1,56 @@
+import base64
+import binascii
+import json
+from decimal import Decimal, DecimalException
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+
+# Cursor pagination for list endpoints: ?limit=N returns at most N items
+# and a nextCursor, an opaque encoding of DynamoDB's LastEvaluatedKey that
+# the client passes back as ?cursor= for the next page. Only one page of
+# items is ever held in memory.
+serializer = TypeSerializer()
+deserializer = TypeDeserializer()
+
+
+def parse_limit(value, default, maximum):
+    """Returns the page size for a ?limit= value, or None when it is not
+    an integer between 1 and `maximum`."""
+    if value is None:
+        return default
+    # str.isdigit() also accepts digits such as "²" that int() rejects.
+    if not (value.isascii() and value.isdigit()) or not 0 < int(value) <= maximum:
+        return None
+    return int(value)
+
+
+def read_page(operation, limit, start_key=None, **kwargs):
+    # Keeps reading until `limit` items are collected or the table is
+    # exhausted, so a filtered scan never returns an empty page mid-way.
+    items = []
+    while True:
+        if start_key:
+            kwargs["ExclusiveStartKey"] = start_key
+        response = operation(Limit=limit - len(items), **kwargs)
+        items.extend(response["Items"])
+        start_key = response.get("LastEvaluatedKey")
+        if not start_key or len(items) >= limit:
+            return items, start_key
+
+
+def encode_cursor(last_key):
+    typed = {k: serializer.serialize(v) for k, v in last_key.items()}
+    return base64.urlsafe_b64encode(json.dumps(typed, separators=(",", ":")).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        typed = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        last_key = {k: deserializer.deserialize(v) for k, v in typed.items()}
+    except (binascii.Error, UnicodeDecodeError, TypeError, AttributeError, json.JSONDecodeError,
+            DecimalException) as e:
+        raise ValueError("Invalid cursor") from e
+    # boto3 does not trap InvalidOperation, so a forged {"N": "abc"} decodes
+    # to NaN, which DynamoDB would then reject.
+    if any(isinstance(v, Decimal) and not v.is_finite() for v in last_key.values()):
+        raise ValueError("Invalid cursor")
+    return last_key
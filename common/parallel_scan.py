@@ -0,0 +1,91 @@
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from common.capacity import CapacityLimiter
+
+logger = logging.getLogger()
+
+# Recorded in `progress` for a segment that has been read to the end.
+SEGMENT_DONE = "DONE"
+
+
+def parallel_scan(table, total_segments=4, max_workers=None, max_read_capacity=None,
+                  max_buffered_pages=None, progress=None, **scan_kwargs):
+    """Scan `table` with `total_segments` concurrent Segment scans and yield
+    every item as one merged stream.
+
+    `max_read_capacity` caps the consumed RCUs per second across all
+    segments. Pages are handed over through a bounded queue, so segments
+    stop reading when the consumer falls behind.
+
+    `progress`, when given, is a dict updated with str(segment) -> the
+    ExclusiveStartKey of that segment's next page, or SEGMENT_DONE, each
+    time the consumer has taken every item of a page. It survives a JSON
+    round trip; passing it to a later call with the same `total_segments`
+    resumes the scan there. A page the consumer only partly took is read
+    again, so items are delivered at least once.
+    """
+    total_segments = max(1, int(total_segments))
+    segments = [
+        segment for segment in range(total_segments)
+        if progress is None or progress.get(str(segment)) != SEGMENT_DONE
+    ]
+    max_workers = max_workers or total_segments
+    max_buffered_pages = max_buffered_pages or max_workers * 2
+    limiter = CapacityLimiter(max_read_capacity) if max_read_capacity else None
+
+    pages = queue.Queue(maxsize=max_buffered_pages)
+    stop_event = threading.Event()
+
+    def put(entry):
+        while not stop_event.is_set():
+            try:
+                pages.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def scan_segment(segment):
+        kwargs = dict(scan_kwargs, Segment=segment, TotalSegments=total_segments)
+        if progress is not None and progress.get(str(segment)):
+            kwargs["ExclusiveStartKey"] = progress[str(segment)]
+        if limiter:
+            kwargs["ReturnConsumedCapacity"] = "TOTAL"
+        try:
+            while not stop_event.is_set():
+                if limiter:
+                    limiter.wait(stop_event)
+                response = table.scan(**kwargs)
+                if limiter:
+                    limiter.consume(response.get("ConsumedCapacity", {}).get("CapacityUnits", 0))
+                last_key = response.get("LastEvaluatedKey")
+                # Every page is handed over, empty ones too, so the consumer
+                # can record progress and sees the segment's last page.
+                if not put((segment, response["Items"], last_key)) or not last_key:
+                    return
+                kwargs["ExclusiveStartKey"] = last_key
+        except Exception as e:
+            logger.exception("Error scanning segment %d of %d", segment, total_segments)
+            put(e)
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        for segment in segments:
+            executor.submit(scan_segment, segment)
+
+        remaining = len(segments)
+        while remaining:
+            entry = pages.get()
+            if isinstance(entry, Exception):
+                raise entry
+            segment, items, last_key = entry
+            yield from items
+            if progress is not None:
+                progress[str(segment)] = last_key or SEGMENT_DONE
+            if not last_key:
+                remaining -= 1
+    finally:
+        stop_event.set()
+        executor.shutdown(wait=True)
@@ -0,0 +1,42 @@
+from common.router import BadRequest
+
+# Sparse reads: ?fields=amount,tdate (or repeated fields= parameters) turns
+# into a ProjectionExpression, so DynamoDB returns, and the encoder and the
+# client handle, only those attributes. Key attributes are always included
+# so list rows stay identifiable.
+
+
+def parse_fields(request, allowed, key_fields=()):
+    """Returns the attributes to read, or None when the request has no
+    fields parameter (full items). Raises BadRequest for names outside
+    `allowed`."""
+    values = request.multi_query.get("fields") or request.query.get("fields")
+    if values is None:
+        return None
+    if isinstance(values, str):
+        values = [values]
+    names = [part.strip() for value in values for part in value.split(",") if part.strip()]
+    if not names:
+        raise BadRequest("fields must name at least one attribute")
+    unknown = sorted(set(names) - set(allowed) - set(key_fields))
+    if unknown:
+        raise BadRequest(f"Unknown fields: {', '.join(unknown)}")
+    return tuple(dict.fromkeys([*key_fields, *names]))
+
+
+def projection(fields):
+    """Keyword arguments for get_item, query, scan or a BatchGetItem request.
+    Every name is aliased, so reserved words (type, action, position...)
+    need no special casing; boto3 merges the aliases of any condition
+    expressions built with Key/Attr into the same ExpressionAttributeNames."""
+    if not fields:
+        return {}
+    names = {f"#p{i}": field for i, field in enumerate(fields)}
+    return {"ProjectionExpression": ", ".join(names), "ExpressionAttributeNames": names}
+
+
+def project(item, fields):
+    """Applies `fields` to an item already in memory, e.g. from a cache."""
+    if item is None or not fields:
+        return item
+    return {field: item[field] for field in fields if field in item}
@@ -0,0 +1,114 @@
+import base64
+import binascii
+import json
+import logging
+from common import apigateway, metrics
+from common.apigateway import build_response, compress_response, resolve_path
+
+logger = logging.getLogger()
+
+
+class BadRequest(Exception):
+    """Raised while reading a request to answer 400 with its message."""
+
+
+class Request:
+    """The parts of an API Gateway proxy event a route handler needs. The
+    stage prefix is stripped once, and the body is only parsed when a
+    handler reads it."""
+
+    __slots__ = ("event", "context", "method", "path", "_body")
+
+    _UNPARSED = object()
+
+    def __init__(self, event, context=None):
+        self.event = event
+        self.context = context
+        self.method = event.get("httpMethod")
+        self.path = resolve_path(event)
+        self._body = self._UNPARSED
+
+    @property
+    def query(self):
+        return self.event.get("queryStringParameters") or {}
+
+    @property
+    def multi_query(self):
+        return self.event.get("multiValueQueryStringParameters") or {}
+
+    @property
+    def headers(self):
+        return self.event.get("headers") or {}
+
+    def header(self, name, default=None):
+        name = name.lower()
+        for key, value in self.headers.items():
+            if key.lower() == name:
+                return value
+        return default
+
+    @property
+    def raw_body(self):
+        """The body as sent. With binary media types configured, API Gateway
+        base64-encodes request bodies and sets isBase64Encoded."""
+        body = self.event.get("body")
+        if body and self.event.get("isBase64Encoded"):
+            try:
+                return base64.b64decode(body, validate=True).decode("utf-8")
+            except (binascii.Error, UnicodeDecodeError):
+                raise BadRequest("Invalid base64 body")
+        return body
+
+    @property
+    def body(self):
+        if self._body is self._UNPARSED:
+            try:
+                self._body = json.loads(self.raw_body or "{}")
+            except ValueError:
+                raise BadRequest("Invalid JSON body")
+            if not isinstance(self._body, dict):
+                raise BadRequest("Request body must be a JSON object")
+        return self._body
+
+
+class Router:
+    """Maps (method, resource) to a handler in a single dict lookup."""
+
+    def __init__(self, error_detail=True):
+        self.routes = {}
+        self.error_detail = error_detail
+
+    def route(self, method, path):
+        def register(handler):
+            self.routes[(method, path)] = handler
+            return handler
+        return register
+
+    def dispatch(self, event, context=None):
+        request = Request(event, context)
+        handler = self.routes.get((request.method, request.path))
+        # Metrics and compression can both be switched off; their per-call
+        # work (route name, header scan) is then skipped entirely.
+        if metrics.ENABLED:
+            # Unmatched paths share one route name to keep metric dimensions bounded.
+            metrics.begin(f"{request.method} {request.path}" if handler else "NotFound")
+        response = self._handle(handler, request)
+        if apigateway.COMPRESSION_ENABLED:
+            response = compress_response(response, request.header("Accept-Encoding"))
+        if metrics.ENABLED:
+            metrics.end(response.get("statusCode"), getattr(context, "aws_request_id", None))
+        return response
+
+    def _handle(self, handler, request):
+        if handler is None:
+            return build_response(404, {"Message": "Path not found"})
+
+        try:
+            return handler(request)
+        except BadRequest as e:
+            return build_response(400, {"Message": str(e)})
+        except Exception as e:
+            logger.exception("Error processing request")
+            if self.error_detail:
+                return build_response(500, {"Message": f"Internal server error: {str(e)}"})
+            return build_response(500, {"Message": "Internal server error"})
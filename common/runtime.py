@@ -0,0 +1,87 @@
+import logging
+import threading
+import time
+
+import boto3
+
+from common import metrics
+
+logger = logging.getLogger()
+
+# Creating a boto3 resource loads and parses the service model, which is the
+# largest part of a cold start. Nothing is created at import time; the
+# first table or client access pays for it, and health checks never do.
+_process_started = time.perf_counter()
+_lock = threading.Lock()
+_resource = None
+_clients = {}
+_first_invocation = True
+
+timings = {}
+
+
+def _timed(name, factory):
+    started = time.perf_counter()
+    value = factory()
+    timings[name] = round((time.perf_counter() - started) * 1000, 2)
+    logger.info("Initialized %s in %s ms", name, timings[name])
+    return value
+
+
+def get_resource():
+    global _resource
+    if _resource is None:
+        with _lock:
+            if _resource is None:
+                _resource = _timed("dynamodbResourceMs", lambda: boto3.resource("dynamodb"))
+    return _resource
+
+
+def get_client(service="dynamodb"):
+    # The low-level client skips the resource model entirely. For DynamoDB
+    # an existing resource's client is reused instead of building a second.
+    client = _clients.get(service)
+    if client is None:
+        with _lock:
+            client = _clients.get(service)
+            if client is None:
+                if service == "dynamodb" and _resource is not None:
+                    client = _resource.meta.client
+                else:
+                    client = _timed(f"{service}ClientMs", lambda: boto3.client(service))
+                _clients[service] = client
+    return client
+
+
+class LazyTable:
+    """Stands in for a boto3 Table and creates it on first attribute access.
+    Item and query calls go through common.metrics instrumentation."""
+
+    def __init__(self, name):
+        self.name = name
+        self._table = None
+
+    def __getattr__(self, attribute):
+        if self._table is None:
+            self._table = get_resource().Table(self.name)
+        value = getattr(self._table, attribute)
+        if attribute in metrics.INSTRUMENTED_OPERATIONS:
+            return metrics.instrument(self.name, attribute, value)
+        return value
+
+
+def lazy_table(name):
+    return LazyTable(name)
+
+
+def mark_invocation():
+    """Logs the init phase duration on the first invocation of a container.
+    Returns True for a cold start."""
+    global _first_invocation
+    if not _first_invocation:
+        return False
+    _first_invocation = False
+    timings["initMs"] = round((time.perf_counter() - _process_started) * 1000, 2)
+    logger.info("Cold start: %s", timings)
+    metrics.note_cold_start(timings["initMs"])
+    return True
@@ -0,0 +1,71 @@
+from functools import lru_cache
+
+# Partial updates for PATCH: only the attributes a request carries are
+# written. A field that is absent or None keeps its stored value; an empty
+# string removes a clearable field and is ignored for any other. Every name
+# is aliased, so reserved words (type, action, position...) need no list.
+
+
+def split_fields(fields, clearable=()):
+    """Splits PATCH values into (set_fields, remove_fields)."""
+    set_fields = {}
+    remove_fields = []
+    for key, value in fields.items():
+        if isinstance(value, str) and value.strip() == "":
+            if key in clearable:
+                remove_fields.append(key)
+        elif value is not None:
+            set_fields[key] = value
+    return set_fields, remove_fields
+
+
+@lru_cache(maxsize=256)
+def update_expression(set_names, remove_names=(), default_names=()):
+    """Returns (UpdateExpression, alias pairs) for tuples of attribute
+    names. Clients send the same few field combinations over and over, so
+    the strings are built once per combination."""
+    aliases = []
+    parts = []
+    clauses = []
+    if set_names:
+        aliases.extend((f"#s{i}", name) for i, name in enumerate(set_names))
+        clauses.extend(f"#s{i} = :s{i}" for i in range(len(set_names)))
+    if default_names:
+        aliases.extend((f"#d{i}", name) for i, name in enumerate(default_names))
+        clauses.extend(f"#d{i} = if_not_exists(#d{i}, :d{i})" for i in range(len(default_names)))
+    if clauses:
+        parts.append("SET " + ", ".join(clauses))
+    if remove_names:
+        aliases.extend((f"#r{i}", name) for i, name in enumerate(remove_names))
+        parts.append("REMOVE " + ", ".join(f"#r{i}" for i in range(len(remove_names))))
+    return " ".join(parts), tuple(aliases)
+
+
+def build_update(set_fields, remove_fields=(), defaults=None, required=()):
+    """Keyword arguments for update_item that set `set_fields`, remove
+    `remove_fields` and set `defaults` only where the stored item has no
+    value yet. A `required` field the update does not set must already be
+    stored, or the update fails its condition check instead of creating an
+    item without it. ExpressionAttributeValues is left out when there is
+    nothing to set, as DynamoDB rejects an empty map."""
+    defaults = defaults or {}
+    expression, aliases = update_expression(tuple(set_fields), tuple(remove_fields), tuple(defaults))
+    kwargs = {"UpdateExpression": expression, "ExpressionAttributeNames": dict(aliases)}
+    missing = [field for field in required if field not in set_fields]
+    if missing:
+        kwargs["ExpressionAttributeNames"].update((f"#c{i}", field) for i, field in enumerate(missing))
+        kwargs["ConditionExpression"] = " AND ".join(f"attribute_exists(#c{i})" for i in range(len(missing)))
+    values = {f":s{i}": value for i, value in enumerate(set_fields.values())}
+    values.update((f":d{i}", value) for i, value in enumerate(defaults.values()))
+    if values:
+        kwargs["ExpressionAttributeValues"] = values
+    return kwargs
+
+
+def apply_update(old_item, key, set_fields, remove_fields=(), defaults=None):
+    """The stored item after the update, from its ALL_OLD image (or just
+    `key` when the update created it), for derived-table deltas."""
+    new_item = {**(defaults or {}), **(old_item or key), **set_fields}
+    for field in remove_fields:
+        new_item.pop(field, None)
+    return new_item
@@ -0,0 +1,134 @@
+import logging
+from decimal import Decimal, InvalidOperation
+from boto3.dynamodb.conditions import Key
+
+logger = logging.getLogger()
+
+# Operations that add to the destination wallet, remove from the source
+# wallet, or move quantity between the two.
+INFLOW_OPERATIONS = {"buy", "deposit", "receive", "reward"}
+OUTFLOW_OPERATIONS = {"sell", "withdraw", "send"}
+TRANSFER_OPERATIONS = {"transfer"}
+
+
+def to_decimal(value):
+    if value is None or value == "":
+        return Decimal(0)
+    try:
+        number = Decimal(str(value))
+    except InvalidOperation:
+        number = None
+    if number is None or not number.is_finite():
+        logger.warning("Ignoring non-numeric quantity: %s", value)
+        return Decimal(0)
+    return number
+
+
+def is_number(value):
+    """True for a finite number, a numeric string or an empty value."""
+    if value is None or value == "":
+        return True
+    try:
+        return Decimal(str(value)).is_finite()
+    except InvalidOperation:
+        return False
+
+
+def holding_id(crypto_name, wallet):
+    return f"{crypto_name}#{wallet}"
+
+
+def holding_deltas(item, sign=1):
+    """Maps (cryptoName, wallet) to [quantity delta, trade count delta] for
+    one crypto operation. `sign=-1` gives the reverse delta."""
+    deltas = {}
+    if not item or not item.get("cryptoName"):
+        return deltas
+
+    name = item["cryptoName"]
+    operation = str(item.get("operation") or "").strip().lower()
+    quantity = to_decimal(item.get("quantity"))
+    fee = to_decimal(item.get("fee")) if item.get("feeCurrency") == name else Decimal(0)
+    from_wallet = item.get("fromWallet") or ""
+    to_wallet = item.get("toWallet") or ""
+
+    def add(wallet, amount):
+        entry = deltas.setdefault((name, wallet), [Decimal(0), 0])
+        entry[0] += sign * amount
+        entry[1] += sign
+
+    if operation in INFLOW_OPERATIONS:
+        add(to_wallet or from_wallet, quantity - fee)
+    elif operation in OUTFLOW_OPERATIONS:
+        add(from_wallet or to_wallet, -quantity - fee)
+    elif operation in TRANSFER_OPERATIONS:
+        add(from_wallet, -quantity - fee)
+        add(to_wallet, quantity)
+    else:
+        logger.warning("Unknown crypto operation '%s', holdings not updated", operation)
+
+    return deltas
+
+
+def merge_deltas(*delta_maps):
+    merged = {}
+    for deltas in delta_maps:
+        for key, (quantity, trades) in deltas.items():
+            entry = merged.setdefault(key, [Decimal(0), 0])
+            entry[0] += quantity
+            entry[1] += trades
+    return {key: value for key, value in merged.items() if value[0] or value[1]}
+
+
+def apply_change(holdings_table, user_id, old_item=None, new_item=None):
+    """Applies the holdings delta for an operation changing from `old_item`
+    to `new_item`. Either side may be None for inserts and deletes."""
+    deltas = merge_deltas(holding_deltas(old_item, sign=-1), holding_deltas(new_item))
+    for (crypto_name, wallet), (quantity, trades) in deltas.items():
+        holdings_table.update_item(
+            Key={
+                "userId": user_id,
+                "holdingId": holding_id(crypto_name, wallet)
+            },
+            UpdateExpression="SET cryptoName = :cryptoName, wallet = :wallet ADD quantity :quantity, trades :trades",
+            ExpressionAttributeValues={
+                ":cryptoName": crypto_name,
+                ":wallet": wallet,
+                ":quantity": quantity,
+                ":trades": trades
+            }
+        )
+
+
+def get_holdings(holdings_table, user_id):
+    response = holdings_table.query(KeyConditionExpression=Key("userId").eq(user_id))
+    result = response["Items"]
+
+    while "LastEvaluatedKey" in response:
+        response = holdings_table.query(
+            ExclusiveStartKey=response["LastEvaluatedKey"],
+            KeyConditionExpression=Key("userId").eq(user_id)
+        )
+        result.extend(response["Items"])
+
+    return result
+
+
+def rebuild_holdings(holdings_table, user_id, cryptos):
+    """Recomputes a user's holdings from their full operation history, for
+    backfilling the table or repairing it after a failed incremental update."""
+    totals = merge_deltas(*(holding_deltas(item) for item in cryptos))
+    with holdings_table.batch_writer() as batch:
+        for item in get_holdings(holdings_table, user_id):
+            if (item["cryptoName"], item["wallet"]) not in totals:
+                batch.delete_item(Key={"userId": user_id, "holdingId": item["holdingId"]})
+        for (crypto_name, wallet), (quantity, trades) in totals.items():
+            batch.put_item(Item={
+                "userId": user_id,
+                "holdingId": holding_id(crypto_name, wallet),
+                "cryptoName": crypto_name,
+                "wallet": wallet,
+                "quantity": quantity,
+                "trades": trades
+            })
+    return len(totals)
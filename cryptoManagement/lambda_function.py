@@ -1,15 +1,44 @@
-import boto3
-import json
+import holdings
 import logging
-from custom_encoder import CustomEncoder
-from boto3.dynamodb.conditions import Attr
+from common import versions
+from common.apigateway import build_response
+from common.batching import batch_get_items
+from common.log import log_event
+from common.projection import parse_fields, projection
+from common.router import Router
+from common.runtime import get_resource, lazy_table, mark_invocation
+from common.updates import apply_update, build_update, split_fields
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.exceptions import ClientError
 
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
 
 dynamodbTableName = "Cryptos"
-dynamodb = boto3.resource("dynamodb")
-table = dynamodb.Table(dynamodbTableName)
+table = lazy_table(dynamodbTableName)
+holdingsTableName = "CryptoHoldings"
+holdings_table = lazy_table(holdingsTableName)
+
+# Attributes a client may ask for with ?fields=; the keys are always returned.
+KEY_FIELDS = ("cryptoId", "userId")
+FIELDS = {
+    "tdate", "cryptoName", "operation", "quantity", "price", "currency", "fee", "feeCurrency",
+    "fromWallet", "toWallet", "note"
+}
+# A PATCH with an empty string removes these; other fields keep their value.
+CLEARABLE_FIELDS = {"fromWallet", "toWallet", "note"}
+# These feed the holdings rollup, so a value that is not a number is
+# refused before the write rather than dropped from the holdings after it.
+NUMERIC_FIELDS = ("quantity", "price", "fee")
+
+# GSI with userId as partition key and tdate as sort key. Tables created
+# before the index existed fall back to a filtered scan. The index is
+# sparse, so every write must leave the item with a tdate or GET /cryptos
+# would not list it.
+USER_INDEX_NAME = "userId-tdate-index"
+user_index_available = None
+
+# GET /cryptos?cryptoId=... reads specific records in one request.
+MAX_CRYPTO_IDS = 500
 
 GET_METHOD = "GET"
 POST_METHOD = "POST"
@@ -19,111 +48,95 @@ DELETE_METHOD = "DELETE"
 HEALTH_PATH = "/healthC"
 CRYPTO_PATH = "/crypto"
 CRYPTOS_PATH = "/cryptos"
+HOLDINGS_PATH = "/cryptos/holdings"
+
+
+router = Router()
 
 
 def lambda_handler(event, context):
-    logger.info(f"Received event: {event}")
-    http_method = event["httpMethod"]
+    log_event(logger, event, context)
+    mark_invocation()
+    return router.dispatch(event, context)
 
-    _path = event.get("path", "")
-    _stage = (event.get("requestContext") or {}).get("stage")
-    if _stage and _path.startswith("/" + _stage + "/"):
-        _path = _path[len(_stage) + 1:]
-    elif _stage and _path == "/" + _stage:
-        _path = "/"
 
-    path = event.get("resource") or _path
+@router.route(GET_METHOD, HEALTH_PATH)
+def handle_health(request):
+    return build_response(200, {"status": "Healthy"})
 
+
+@router.route(GET_METHOD, CRYPTO_PATH)
+def handle_get_crypto(request):
+    crypto_id = request.query.get("cryptoId")
+    user_id = request.query.get("userId")
+
+    if not crypto_id or not user_id:
+        return build_response(400, {"Message": "cryptoId and userId are required"})
+    return get_crypto(crypto_id, user_id, parse_fields(request, FIELDS, KEY_FIELDS))
+
+
+@router.route(GET_METHOD, CRYPTOS_PATH)
+def handle_get_cryptos(request):
+    user_id = request.query.get("userId")
+    crypto_ids = parse_id_list(request.multi_query.get("cryptoId") or request.query.get("cryptoId"))
+
+    if not user_id:
+        return build_response(400, {"Message": "Missing required parameter: userId"})
+    if len(crypto_ids) > MAX_CRYPTO_IDS:
+        return build_response(400, {"Message": f"At most {MAX_CRYPTO_IDS} cryptoId values per request"})
+    fields = parse_fields(request, FIELDS, KEY_FIELDS)
+    etag, not_modified = versions.conditional_get(request, user_id, versions.CRYPTOS)
+    if not_modified:
+        return not_modified
+    if crypto_ids:
+        return get_cryptos_by_id(crypto_ids, user_id, etag, fields)
+    return get_cryptos(user_id, etag, fields)
+
+
+@router.route(GET_METHOD, HOLDINGS_PATH)
+def handle_get_holdings(request):
+    user_id = request.query.get("userId")
+
+    if not user_id:
+        return build_response(400, {"Message": "Missing required parameter: userId"})
+    return get_holdings(user_id)
+
+
+@router.route(POST_METHOD, CRYPTO_PATH)
+def handle_save_crypto(request):
+    return save_crypto(request.body)
+
+
+@router.route(PATCH_METHOD, CRYPTO_PATH)
+def handle_modify_crypto(request):
+    body = request.body
+    crypto_id = body.get("cryptoId")
+    user_id = body.get("userId")
+
+    if not crypto_id or not user_id:
+        return build_response(400, {"Message": "Missing required fields for updating crypto"})
+    return modify_crypto(crypto_id, user_id, {k: v for k, v in body.items() if k in FIELDS})
+
+
+@router.route(DELETE_METHOD, CRYPTO_PATH)
+def handle_delete_crypto(request):
+    crypto_id = request.body.get("cryptoId")
+    user_id = request.body.get("userId")
+
+    if not crypto_id or not user_id:
+        return build_response(400, {"Message": "cryptoId and userId are required"})
+    return delete_crypto(crypto_id, user_id)
+
+
+def get_crypto(crypto_id, user_id, fields=None):
     try:
-        if http_method == GET_METHOD and path == HEALTH_PATH:
-            response = build_response(200, {"status": "Healthy"})
-
-        elif http_method == GET_METHOD and path == CRYPTO_PATH:
-            query_params = event.get("queryStringParameters") or {}
-            crypto_id = query_params.get("cryptoId")
-            user_id = query_params.get("userId")
-
-            if not crypto_id or not user_id:
-                response = build_response(400, {"Message": "cryptoId and userId are required"})
-            else:
-                response = get_crypto(crypto_id, user_id)
-
-        elif http_method == GET_METHOD and path == CRYPTOS_PATH:
-            query_params = event.get("queryStringParameters") or {}
-            user_id = query_params.get("userId")
-
-            if not user_id:
-                response = build_response(400, {"Message": "Missing required parameter: userId"})
-            else:
-                response = get_cryptos(user_id)
-
-        elif http_method == POST_METHOD and path == CRYPTO_PATH:
-            request_body = json.loads(event.get("body") or "{}")
-            response = save_crypto(request_body)
-
-        elif http_method == PATCH_METHOD and path == CRYPTO_PATH:
-            request_body = json.loads(event.get("body") or "{}")
-            crypto_id = request_body.get("cryptoId")
-            user_id = request_body.get("userId")
-            cryptoName = request_body.get("cryptoName")
-            tdate = request_body.get("tdate")
-            from_wallet = request_body.get("fromWallet")
-            to_wallet = request_body.get("toWallet")
-            operation = request_body.get("operation")
-            quantity = request_body.get("quantity")
-            price = request_body.get("price")
-            currency = request_body.get("currency")
-            fee = request_body.get("fee")
-            feeCurrency = request_body.get("feeCurrency")
-            note = request_body.get("note")
-
-            if not crypto_id or not user_id:
-                response = build_response(400, {"Message": "Missing required fields for updating crypto"})
-            else:
-                response = modify_crypto(
-                    crypto_id,
-                    user_id,
-                    cryptoName,
-                    tdate,
-                    from_wallet,
-                    to_wallet,
-                    operation,
-                    quantity,
-                    price,
-                    currency,
-                    fee,
-                    feeCurrency,
-                    note
-                )
-
-        elif http_method == DELETE_METHOD and path == CRYPTO_PATH:
-            request_body = json.loads(event.get("body") or "{}")
-            crypto_id = request_body.get("cryptoId")
-            user_id = request_body.get("userId")
-
-            if not crypto_id or not user_id:
-                response = build_response(400, {"Message": "cryptoId and userId are required"})
-            else:
-                response = delete_crypto(crypto_id, user_id)
-
-        else:
-            response = build_response(404, {"Message": "Path not found"})
-
-    except Exception as e:
-        logger.exception("Error processing request")
-        return build_response(500, {"Message": f"Internal server error: {str(e)}"})
-
-    return response
-
-
-def get_crypto(crypto_id, user_id):
-    try:
-        logger.info(f"Fetching crypto with Key: {{'cryptoId': {crypto_id}, 'userId': '{user_id}'}}")
+        logger.info("Fetching crypto with Key: %s", {"cryptoId": crypto_id, "userId": user_id})
         response = table.get_item(
             Key={
                 "cryptoId": crypto_id,
                 "userId": user_id
-            }
+            },
+            **projection(fields)
         )
 
         if "Item" in response:
@@ -135,36 +148,120 @@ def get_crypto(crypto_id, user_id):
         return build_response(500, {"Message": "Error retrieving crypto"})
 
 
-def get_cryptos(user_id):
+def get_cryptos(user_id, etag=None, fields=None):
     try:
-        response = table.scan(
-            FilterExpression=Attr("userId").eq(user_id)
-        )
-        result = response["Items"]
+        result = query_user_cryptos(user_id, fields)
+        return build_response(200, {"cryptos": result}, etag=etag)
+
+    except Exception:
+        logger.exception("Error retrieving cryptos")
+        return build_response(500, {"Message": "Error retrieving cryptos"})
 
-        while "LastEvaluatedKey" in response:
-            response = table.scan(
-                ExclusiveStartKey=response["LastEvaluatedKey"],
-                FilterExpression=Attr("userId").eq(user_id)
-            )
-            result.extend(response["Items"])
 
-        return build_response(200, {"cryptos": result})
+def get_cryptos_by_id(crypto_ids, user_id, etag=None, fields=None):
+    try:
+        keys = [{"cryptoId": crypto_id, "userId": user_id} for crypto_id in crypto_ids]
+        items = batch_get_items(get_resource(), dynamodbTableName, keys, **projection(fields))
+        found = {item["cryptoId"]: item for item in items}
+        return build_response(200, {
+            "cryptos": [found[crypto_id] for crypto_id in crypto_ids if crypto_id in found],
+            "missing": [crypto_id for crypto_id in crypto_ids if crypto_id not in found]
+        }, etag=etag)
 
     except Exception:
-        logger.exception("Error retrieving cryptos")
+        logger.exception("Error retrieving cryptos by id")
         return build_response(500, {"Message": "Error retrieving cryptos"})
 
 
+def parse_id_list(values):
+    # Accepts repeated parameters (?cryptoId=a&cryptoId=b), a comma-separated
+    # value (?cryptoId=a,b) or both. Duplicates are dropped, since
+    # BatchGetItem rejects repeated keys; the first-seen order is kept.
+    if values is None:
+        return []
+    if isinstance(values, str):
+        values = [values]
+    ids = (part.strip() for value in values for part in value.split(","))
+    return list(dict.fromkeys(part for part in ids if part))
+
+
+def query_user_cryptos(user_id, fields=None):
+    global user_index_available
+
+    if user_index_available is not False:
+        try:
+            result = collect_pages(
+                table.query,
+                IndexName=USER_INDEX_NAME,
+                KeyConditionExpression=Key("userId").eq(user_id),
+                **projection(fields)
+            )
+            user_index_available = True
+            return result
+        except ClientError as e:
+            if not is_missing_index_error(e):
+                raise
+            logger.warning("Index %s not found on %s, falling back to scan", USER_INDEX_NAME, dynamodbTableName)
+            user_index_available = False
+
+    return collect_pages(table.scan, FilterExpression=Attr("userId").eq(user_id), **projection(fields))
+
+
+def collect_pages(operation, **kwargs):
+    response = operation(**kwargs)
+    result = response["Items"]
+
+    while "LastEvaluatedKey" in response:
+        response = operation(ExclusiveStartKey=response["LastEvaluatedKey"], **kwargs)
+        result.extend(response["Items"])
+
+    return result
+
+
+def is_missing_index_error(error):
+    err = error.response.get("Error", {})
+    return err.get("Code") == "ValidationException" and "index" in err.get("Message", "").lower()
+
+
+def get_holdings(user_id):
+    try:
+        result = holdings.get_holdings(holdings_table, user_id)
+        return build_response(200, {"holdings": result})
+
+    except Exception:
+        logger.exception("Error retrieving holdings")
+        return build_response(500, {"Message": "Error retrieving holdings"})
+
+
+def invalid_numbers(fields):
+    return [name for name in NUMERIC_FIELDS if not holdings.is_number(fields.get(name))]
+
+
+def update_holdings(user_id, old_item, new_item):
+    # The crypto write has already succeeded at this point; a failed holdings
+    # update is logged and can be repaired with holdings.rebuild_holdings.
+    try:
+        holdings.apply_change(holdings_table, user_id, old_item, new_item)
+    except Exception:
+        logger.exception("Error updating holdings for userId: %s", user_id)
+
+
 def save_crypto(request_body):
     try:
         if not request_body.get("operation"):
             return build_response(400, {"Message": "Missing required field: operation"})
+        if not request_body.get("tdate"):
+            return build_response(400, {"Message": "Missing required field: tdate"})
+        invalid = invalid_numbers(request_body)
+        if invalid:
+            return build_response(400, {"Message": f"{', '.join(invalid)} must be numbers"})
 
         if not request_body.get("feeCurrency") and request_body.get("currency"):
             request_body["feeCurrency"] = request_body.get("currency")
 
-        table.put_item(Item=request_body)
+        response = table.put_item(Item=request_body, ReturnValues="ALL_OLD")
+        update_holdings(request_body.get("userId"), response.get("Attributes"), request_body)
+        versions.bump(request_body.get("userId"), versions.CRYPTOS)
         return build_response(200, {
             "Operation": "SAVE",
             "Message": "SUCCESS",
@@ -176,72 +273,41 @@ def save_crypto(request_body):
         return build_response(500, {"Message": "Error saving crypto"})
 
 
-def modify_crypto(
-    crypto_id,
-    user_id,
-    cryptoName,
-    tdate,
-    from_wallet,
-    to_wallet,
-    operation,
-    quantity,
-    price,
-    currency,
-    fee,
-    feeCurrency,
-    note
-):
+def modify_crypto(crypto_id, user_id, fields):
     try:
-        if not operation:
-            return build_response(400, {"Message": "Missing required field: operation"})
-
-        if not feeCurrency and currency:
-            feeCurrency = currency
-
-        update_expression = """
-        SET cryptoName = :cryptoName,
-            tdate = :tdate,
-            fromWallet = :fromWallet,
-            toWallet = :toWallet,
-            operation = :operation,
-            quantity = :quantity,
-            price = :price,
-            currency = :currency,
-            fee = :fee,
-            feeCurrency = :feeCurrency,
-            note = :note
-        """
-
-        expression_attribute_values = {
-            ":cryptoName": cryptoName,
-            ":tdate": tdate,
-            ":fromWallet": from_wallet,
-            ":toWallet": to_wallet,
-            ":operation": operation,
-            ":quantity": quantity,
-            ":price": price,
-            ":currency": currency,
-            ":fee": fee,
-            ":feeCurrency": feeCurrency,
-            ":note": note
-        }
-
+        set_fields, remove_fields = split_fields(fields, CLEARABLE_FIELDS)
+        if not set_fields and not remove_fields:
+            return build_response(400, {"Message": "No fields to update"})
+        invalid = invalid_numbers(set_fields)
+        if invalid:
+            return build_response(400, {"Message": f"{', '.join(invalid)} must be numbers"})
+
+        # The fee currency follows the trade currency only when the item has
+        # none stored yet, so a fee paid in e.g. BTC is not overwritten.
+        defaults = {}
+        if not set_fields.get("feeCurrency") and set_fields.get("currency"):
+            defaults["feeCurrency"] = set_fields["currency"]
+
+        key = {"cryptoId": crypto_id, "userId": user_id}
         response = table.update_item(
-            Key={
-                "cryptoId": crypto_id,
-                "userId": user_id
-            },
-            UpdateExpression=update_expression,
-            ExpressionAttributeValues=expression_attribute_values,
-            ReturnValues="UPDATED_NEW"
+            Key=key, ReturnValues="ALL_OLD", **build_update(set_fields, remove_fields, defaults, ("tdate",))
         )
 
+        old_item = response.get("Attributes")
+        update_holdings(user_id, old_item, apply_update(old_item, key, set_fields, remove_fields, defaults))
+        versions.bump(user_id, versions.CRYPTOS)
+
         return build_response(200, {
             "Operation": "UPDATE",
             "Message": "SUCCESS",
-            "UpdatedAttributes": response["Attributes"]
+            "UpdatedAttributes": set_fields
         })
 
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") == "ConditionalCheckFailedException":
+            return build_response(400, {"Message": "Missing required field: tdate"})
+        logger.exception("Error updating crypto")
+        return build_response(500, {"Message": "Error updating crypto"})
     except Exception:
         logger.exception("Error updating crypto")
         return build_response(500, {"Message": "Error updating crypto"})
@@ -258,6 +324,8 @@ def delete_crypto(crypto_id, user_id):
         )
 
         if "Attributes" in response:
+            update_holdings(user_id, response["Attributes"], None)
+            versions.bump(user_id, versions.CRYPTOS)
             return build_response(200, {
                 "Operation": "DELETE",
                 "Message": "SUCCESS",
@@ -268,16 +336,3 @@ def delete_crypto(crypto_id, user_id):
     except Exception:
         logger.exception("Error deleting crypto")
         return build_response(500, {"Message": "Error deleting crypto"})
-
-
-def build_response(status_code, body=None):
-    response = {
-        "statusCode": status_code,
-        "headers": {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": "*"
-        }
-    }
-    if body is not None:
-        response["body"] = json.dumps(body, cls=CustomEncoder)
-    return response
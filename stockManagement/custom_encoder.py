@@ -1,9 +0,0 @@
-import json 
-from decimal import Decimal
-
-class CustomEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, Decimal):
-            return float(obj)
-
-        return json.JSONEncoder.default(self, obj)
\ No newline at end of file
@@ -1,15 +1,41 @@
-import boto3
-import json
 import logging
-from custom_encoder import CustomEncoder
-from decimal import Decimal
+import os
+from common import versions
+from common.apigateway import build_response
+from common.log import log_event
+from common.parallel_scan import parallel_scan
+from common.projection import parse_fields, projection
+from common.router import Router
+from common.runtime import lazy_table, mark_invocation
+from common.updates import build_update, split_fields
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.exceptions import ClientError
 
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
 
 dynamodbTableName = "Stocks"
-dynamodb = boto3.resource("dynamodb")
-table = dynamodb.Table(dynamodbTableName)
+table = lazy_table(dynamodbTableName)
+
+# Attributes a client may ask for with ?fields=; the keys are always returned.
+KEY_FIELDS = ("stockId", "userId")
+FIELDS = {
+    "tdate", "stockName", "side", "quantity", "price", "currency", "fee", "feeCurrency",
+    "fromWallet", "toWallet", "note"
+}
+# A PATCH with an empty string removes these; other fields keep their value.
+CLEARABLE_FIELDS = {"fromWallet", "toWallet", "note"}
+
+# GSI with userId as partition key and tdate as sort key. Tables created
+# before the index existed fall back to a filtered scan. The index is
+# sparse, so every write must leave the item with a tdate or
+# GET /stocks would not list it.
+USER_INDEX_NAME = "userId-tdate-index"
+user_index_available = None
+
+# Parallel scan settings for full-table reads: GET /stocks without userId
+# and the filtered scan used while the user index is missing.
+SCAN_TOTAL_SEGMENTS = int(os.environ.get("SCAN_TOTAL_SEGMENTS", "4"))
+SCAN_MAX_READ_CAPACITY = float(os.environ.get("SCAN_MAX_READ_CAPACITY", "0")) or None
 
 GET_METHOD = "GET"
 POST_METHOD = "POST"
@@ -18,85 +44,83 @@ DELETE_METHOD = "DELETE"
 HEALTH_PATH = "/healthC"
 STOCK_PATH = "/stock"
 STOCKS_PATH = "/stocks"
+POSITIONS_PATH = "/stocks/positions"
+
+router = Router()
 
 def lambda_handler(event, context):
-    logger.info(f"Received event: {event}")    
-    http_method = event["httpMethod"]
-    _path = event.get("path", "")
-    _stage = (event.get("requestContext") or {}).get("stage")
-    if _stage and _path.startswith("/" + _stage + "/"):
-        _path = _path[len(_stage) + 1:]
-    elif _stage and _path == "/" + _stage:
-        _path = "/"
-    path = event.get("resource") or _path
-    
-    try:
-        if http_method == GET_METHOD and path == HEALTH_PATH:
-            response = build_response(200, {"status": "Healthy"})
-            
-        elif http_method == GET_METHOD and path == STOCK_PATH:
-            query_params = event.get("queryStringParameters", {})
-            stock_id = query_params.get("stockId")
-            user_id = query_params.get("userId")
-
-            if not stock_id or not user_id:
-                response = build_response(400, {"Message": "stockId and userId are required"})
-            else:
-                response = get_stock(stock_id, user_id)
-            
-        elif http_method == GET_METHOD and path == STOCKS_PATH:
-            response = get_stocks()
-            
-        elif http_method == POST_METHOD and path == STOCK_PATH:
-            response = save_stock(json.loads(event["body"]))
-   
-        elif http_method == PATCH_METHOD and path == STOCK_PATH:
-            request_body = json.loads(event["body"])
-            stock_id = request_body.get("stockId")
-            user_id = request_body.get("userId")
-            stockName = request_body.get("stockName")
-            tdate = request_body.get("tdate")
-            from_wallet = request_body.get("fromWallet")
-            to_wallet = request_body.get("toWallet")
-            side = request_body.get("side")
-            quantity = request_body.get("quantity")
-            price = request_body.get("price")
-            currency = request_body.get("currency")
-            fee = request_body.get("fee")
-            feeCurrency = request_body.get("feeCurrency")
-            note = request_body.get("note")
-
-            if not stock_id or not user_id:
-                response = build_response(400, {"Message": "Missing required fields for updating stock"})
-            else:
-                response = modify_stock(stock_id, user_id, stockName, tdate, from_wallet, to_wallet, side, quantity, price, currency, fee, feeCurrency, note)
-        
-        elif http_method == DELETE_METHOD and path == STOCK_PATH:
-            request_body = json.loads(event["body"])
-            stock_id = request_body.get("stockId")
-            user_id = request_body.get("userId")
-            
-            if not stock_id or not user_id:
-                response = build_response(400, {"Message": "stockId and userId are required"})
-            else:
-                response = delete_stock(stock_id, user_id)
-        
-        else:
-            response = build_response(404, {"Message": "Path not found"})
-    except Exception as e:
-        logger.exception("Error processing request")
-        return build_response(500, {"Message": f"Internal server error: {str(e)}"})
-    return response
+    log_event(logger, event, context)
+    mark_invocation()
+    return router.dispatch(event, context)
+
+@router.route(GET_METHOD, HEALTH_PATH)
+def handle_health(request):
+    return build_response(200, {"status": "Healthy"})
+
+@router.route(GET_METHOD, STOCK_PATH)
+def handle_get_stock(request):
+    stock_id = request.query.get("stockId")
+    user_id = request.query.get("userId")
+
+    if not stock_id or not user_id:
+        return build_response(400, {"Message": "stockId and userId are required"})
+    return get_stock(stock_id, user_id, parse_fields(request, FIELDS, KEY_FIELDS))
+
+@router.route(GET_METHOD, STOCKS_PATH)
+def handle_get_stocks(request):
+    # Without userId the whole table is scanned, as before; with it the
+    # list is scoped to the user and supports conditional requests.
+    user_id = request.query.get("userId")
+    fields = parse_fields(request, FIELDS, KEY_FIELDS)
 
-def get_stock(stock_id, user_id):
+    if not user_id:
+        return get_stocks(fields)
+    etag, not_modified = versions.conditional_get(request, user_id, versions.STOCKS)
+    if not_modified:
+        return not_modified
+    return get_user_stocks(user_id, etag, fields)
+
+@router.route(GET_METHOD, POSITIONS_PATH)
+def handle_get_positions(request):
+    user_id = request.query.get("userId")
+
+    if not user_id:
+        return build_response(400, {"Message": "Missing required parameter: userId"})
+    return get_positions(user_id)
+
+@router.route(POST_METHOD, STOCK_PATH)
+def handle_save_stock(request):
+    return save_stock(request.body)
+
+@router.route(PATCH_METHOD, STOCK_PATH)
+def handle_modify_stock(request):
+    body = request.body
+    stock_id = body.get("stockId")
+    user_id = body.get("userId")
+
+    if not stock_id or not user_id:
+        return build_response(400, {"Message": "Missing required fields for updating stock"})
+    return modify_stock(stock_id, user_id, {k: v for k, v in body.items() if k in FIELDS})
+
+@router.route(DELETE_METHOD, STOCK_PATH)
+def handle_delete_stock(request):
+    stock_id = request.body.get("stockId")
+    user_id = request.body.get("userId")
+
+    if not stock_id or not user_id:
+        return build_response(400, {"Message": "stockId and userId are required"})
+    return delete_stock(stock_id, user_id)
+
+def get_stock(stock_id, user_id, fields=None):
     try:
-        logger.info(f"Fetching stock with Key: {{'stockId': {stock_id}, 'userId': '{user_id}'}}")
+        logger.info("Fetching stock with Key: %s", {"stockId": stock_id, "userId": user_id})
 
         response = table.get_item(
             Key={
                 "stockId": stock_id,
                 "userId": user_id
-            }
+            },
+            **projection(fields)
         )
 
         if "Item" in response:
@@ -107,23 +131,83 @@ def get_stock(stock_id, user_id):
         logger.exception("Error retrieving stock")
         return build_response(500, {"Message": "Error retrieving stock"})
 
-def get_stocks():
+def get_stocks(fields=None):
     try:
-        response = table.scan()
-        result = response["Items"]
-
-        while "LastEvaluatedKey" in response:
-            response = table.scan(ExclusiveStartKey=response["LastEvaluatedKey"])
-            result.extend(response["Items"])
-
+        result = list(scan_stocks(**projection(fields)))
         return build_response(200, {"stocks": result})
     except Exception as e:
         logger.exception("Error retrieving stocks")
         return build_response(500, {"Message": "Error retrieving stocks"})
 
+def get_user_stocks(user_id, etag=None, fields=None):
+    try:
+        return build_response(200, {"stocks": query_user_stocks(user_id, fields)}, etag=etag)
+    except Exception as e:
+        logger.exception("Error retrieving stocks")
+        return build_response(500, {"Message": "Error retrieving stocks"})
+
+def scan_stocks(total_segments=None, max_read_capacity=None, **scan_kwargs):
+    return parallel_scan(
+        table,
+        total_segments=total_segments or SCAN_TOTAL_SEGMENTS,
+        max_read_capacity=max_read_capacity or SCAN_MAX_READ_CAPACITY,
+        **scan_kwargs
+    )
+
+def get_positions(user_id):
+    try:
+        # NumPy is only needed here, so it stays out of the cold start of
+        # every other route.
+        from positions import compute_positions
+
+        result = compute_positions(query_user_stocks(user_id))
+        return build_response(200, {"positions": result})
+    except Exception as e:
+        logger.exception("Error computing positions")
+        return build_response(500, {"Message": "Error computing positions"})
+
+def query_user_stocks(user_id, fields=None):
+    global user_index_available
+
+    if user_index_available is not False:
+        try:
+            result = collect_pages(
+                table.query,
+                IndexName=USER_INDEX_NAME,
+                KeyConditionExpression=Key("userId").eq(user_id),
+                **projection(fields)
+            )
+            user_index_available = True
+            return result
+        except ClientError as e:
+            if not is_missing_index_error(e):
+                raise
+            logger.warning("Index %s not found on %s, falling back to scan", USER_INDEX_NAME, dynamodbTableName)
+            user_index_available = False
+
+    return list(scan_stocks(FilterExpression=Attr("userId").eq(user_id), **projection(fields)))
+
+def collect_pages(operation, **kwargs):
+    response = operation(**kwargs)
+    result = response["Items"]
+
+    while "LastEvaluatedKey" in response:
+        response = operation(ExclusiveStartKey=response["LastEvaluatedKey"], **kwargs)
+        result.extend(response["Items"])
+
+    return result
+
+def is_missing_index_error(error):
+    err = error.response.get("Error", {})
+    return err.get("Code") == "ValidationException" and "index" in err.get("Message", "").lower()
+
 def save_stock(request_body):
     try:
+        if not request_body.get("tdate"):
+            return build_response(400, {"Message": "Missing required field: tdate"})
+
         table.put_item(Item=request_body)
+        versions.bump(request_body.get("userId"), versions.STOCKS)
         return build_response(200, {
             "Operation": "SAVE",
             "Message": "SUCCESS",
@@ -134,46 +218,28 @@ def save_stock(request_body):
         return build_response(500, {"Message": "Error saving stock"})
 
 
-def modify_stock(stock_id, user_id, stockName, tdate, from_wallet, to_wallet, side, quantity, price, currency, fee, feeCurrency, note):
+def modify_stock(stock_id, user_id, fields):
     try:
-        update_expression = """
-            SET stockName = :stockName,
-                tdate = :tdate,
-                fromWallet = :fromWallet,
-                toWallet = :toWallet,
-                side = :side,
-                quantity = :quantity,
-                price = :price,
-                currency = :currency,
-                fee = :fee,
-                feeCurrency = :feeCurrency,
-                note = :note
-        """
-        expression_attribute_values = {
-            ":stockName": stockName,
-            ":tdate": tdate,
-            ":fromWallet": from_wallet,
-            ":toWallet": to_wallet,
-            ":side": side,
-            ":quantity": quantity,
-            ":price": price,
-            ":currency": currency,
-            ":fee": fee,
-            ":feeCurrency": feeCurrency,
-            ":note": note
-        }
+        set_fields, remove_fields = split_fields(fields, CLEARABLE_FIELDS)
+        if not set_fields and not remove_fields:
+            return build_response(400, {"Message": "No fields to update"})
 
         response = table.update_item(
             Key={"stockId": stock_id, "userId": user_id},
-            UpdateExpression=update_expression,
-            ExpressionAttributeValues=expression_attribute_values,
             ReturnValues="UPDATED_NEW",
+            **build_update(set_fields, remove_fields, required=("tdate",))
         )
+        versions.bump(user_id, versions.STOCKS)
         return build_response(200, {
             "Operation": "UPDATE",
             "Message": "SUCCESS",
-            "UpdatedAttributes": response["Attributes"],
+            "UpdatedAttributes": response.get("Attributes", {}),
         })
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") == "ConditionalCheckFailedException":
+            return build_response(400, {"Message": "Missing required field: tdate"})
+        logger.exception("Error updating stock")
+        return build_response(500, {"Message": "Error updating stock"})
     except Exception:
         logger.exception("Error updating stock")
         return build_response(500, {"Message": "Error updating stock"})
@@ -189,6 +255,7 @@ def delete_stock(stock_id, user_id):
             ReturnValues="ALL_OLD"
         )
         if "Attributes" in response:
+            versions.bump(user_id, versions.STOCKS)
             return build_response(200, {
                 "Operation": "DELETE",
                 "Message": "SUCCESS",
@@ -200,16 +267,3 @@ def delete_stock(stock_id, user_id):
         logger.exception("Error deleting stock")
         return build_response(500, {"Message": "Error deleting stock"})
 
-
-def build_response(status_code, body=None):
-    response = {
-        "statusCode": status_code,
-        "headers": {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": "*"
-        }
-    }
-    if body is not None:
-        response["body"] = json.dumps(body, cls=CustomEncoder)
-    return response
-
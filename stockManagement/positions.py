@@ -0,0 +1,203 @@
+import numpy as np
+
+BUY_SIDES = {"buy"}
+SELL_SIDES = {"sell"}
+EPSILON = 1e-9
+# Nats between one average-cost cycle's log terms and the previous ones':
+# e**-40 is far below float64 precision.
+CYCLE_MARGIN = 40.0
+
+
+class TradeColumns:
+    """A user's trades as parallel NumPy columns, sorted by stockName and
+    tdate so every symbol occupies one contiguous block of rows."""
+
+    def __init__(self, trades):
+        rows = [
+            t for t in trades
+            if t.get("stockName") and str(t.get("side") or "").strip().lower() in BUY_SIDES | SELL_SIDES
+        ]
+        rows.sort(key=lambda t: (t["stockName"], str(t.get("tdate") or ""), str(t.get("stockId") or "")))
+
+        self.size = len(rows)
+        self.names, self.symbol = np.unique([t["stockName"] for t in rows], return_inverse=True)
+        self.symbol = self.symbol.astype(np.int64)
+        self.is_buy = np.array([str(t["side"]).strip().lower() in BUY_SIDES for t in rows], dtype=bool)
+        self.quantity = np.abs(np.array([_number(t.get("quantity")) for t in rows], dtype=np.float64))
+        self.price = np.array([_number(t.get("price")) for t in rows], dtype=np.float64)
+        # Fees paid in another currency than the trade cannot be added to
+        # the cost basis without an exchange rate, so they are left out.
+        self.fee = np.array([
+            _number(t.get("fee")) if t.get("feeCurrency") in (None, "", t.get("currency")) else 0.0
+            for t in rows
+        ], dtype=np.float64)
+
+        currencies = {}
+        for t in rows:
+            currencies.setdefault(t["stockName"], t.get("currency"))
+        self.currencies = [currencies[name] for name in self.names]
+
+
+def _number(value):
+    if value is None or value == "":
+        return 0.0
+    return float(value)
+
+
+def _segments(starts):
+    bounds = np.r_[np.flatnonzero(starts), len(starts)]
+    return zip(bounds[:-1].tolist(), bounds[1:].tolist())
+
+
+def _grouped_cumsum(values, starts):
+    # Summed symbol by symbol: one cumsum over every row would carry the
+    # rounding error of all earlier symbols into the later ones.
+    result = np.empty_like(values)
+    for begin, end in _segments(starts):
+        np.cumsum(values[begin:end], out=result[begin:end])
+    return result
+
+
+def _average_cost(symbol, is_buy, held_before, held_after, inflow, proceeds, symbol_start, symbol_last, n_symbols):
+    """Average cost: a buy adds its cost to the held cost, a sell removes
+    the share of it that the sold units carried and keeps the average
+    price. The cost held after row t is therefore the sum of each earlier
+    buy's cost times the product of the sell ratios (held after / held
+    before) since that buy. A sell that closes the position starts a new
+    cycle at zero cost, as does each symbol.
+
+    The product underflows over long histories, so it is kept in log
+    space, with `level` the running sum of log sell ratios in the cycle:
+
+        log cost[t] = level[t] + logaddexp.accumulate(log inflow[j] - level[j])
+
+    A ufunc accumulate cannot restart at each cycle, so every cycle's terms
+    are raised by an offset that puts them at least CYCLE_MARGIN above
+    everything accumulated before it: the earlier cycles' share of the sum
+    is then below float precision, and the offset is subtracted again."""
+    is_sell = ~is_buy
+    has_units = held_before > EPSILON
+    ratio = np.where(
+        is_sell,
+        np.where(has_units, np.clip(held_after / np.where(has_units, held_before, 1.0), 0.0, 1.0), 0.0),
+        1.0,
+    )
+    closing = is_sell & (ratio <= EPSILON)
+    cycle_start = symbol_start | np.r_[False, closing[:-1]]
+    cycle = np.cumsum(cycle_start) - 1
+    first_rows = np.flatnonzero(cycle_start)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_ratio = np.log(np.where(closing, 1.0, ratio))
+        symbol_level = _grouped_cumsum(log_ratio, symbol_start)
+        level = symbol_level - (symbol_level - log_ratio)[first_rows][cycle]
+        terms = np.where(is_buy, np.log(inflow) - level, -np.inf)
+
+    finite = np.isfinite(terms)
+    highest = np.maximum.reduceat(np.where(finite, terms, -np.inf), first_rows)
+    lowest = np.minimum.reduceat(np.where(finite, terms, np.inf), first_rows)
+    has_terms = np.isfinite(highest)
+    spread = np.where(has_terms, highest - lowest, 0.0) + CYCLE_MARGIN
+    # Offsets only need to grow within a symbol, so restart them there too.
+    ceiling = _grouped_cumsum(spread, symbol_start[first_rows])
+    offset = (ceiling - np.where(has_terms, highest, 0.0))[cycle]
+
+    log_cost = np.empty_like(terms)
+    with np.errstate(invalid="ignore"):
+        for begin, end in _segments(symbol_start):
+            log_cost[begin:end] = np.logaddexp.accumulate(terms[begin:end] + offset[begin:end])
+    bought = np.cumsum(is_buy)
+    has_cost = (bought - (bought - is_buy)[first_rows][cycle] > 0) & ~closing
+    cost_after = np.where(has_cost, np.exp(level + log_cost - offset), 0.0)
+
+    cost_before = np.where(cycle_start, 0.0, np.r_[0.0, cost_after[:-1]])
+    removed = cost_before * (1.0 - ratio)
+    realized = np.bincount(symbol, weights=np.where(is_sell, proceeds - removed, 0.0), minlength=n_symbols)
+    return cost_after[symbol_last], realized
+
+
+def compute_positions(trades):
+    """Average-cost and FIFO cost basis, realized P&L and open quantity per
+    stockName. FIFO and the quantities are computed over whole columns at
+    once, average cost with one accumulate per symbol."""
+    cols = trades if isinstance(trades, TradeColumns) else TradeColumns(trades)
+    if cols.size == 0:
+        return []
+
+    n_symbols = len(cols.names)
+    symbol, is_buy, quantity = cols.symbol, cols.is_buy, cols.quantity
+    is_sell = ~is_buy
+    symbol_start = np.r_[True, symbol[1:] != symbol[:-1]]
+    symbol_last = np.r_[symbol_start[1:], True]
+
+    signed = np.where(is_buy, quantity, -quantity)
+    held_after = _grouped_cumsum(signed, symbol_start)
+    held_before = held_after - signed
+
+    inflow = np.where(is_buy, quantity * cols.price + cols.fee, 0.0)
+    proceeds = np.where(is_sell, quantity * cols.price - cols.fee, 0.0)
+
+    avg_cost_basis, avg_realized = _average_cost(
+        symbol, is_buy, held_before, held_after, inflow, proceeds, symbol_start, symbol_last, n_symbols
+    )
+
+    # FIFO: the cost of the first x units bought is piecewise linear in the
+    # cumulative bought quantity, so the cost of the units each sell consumes
+    # is an interpolation. Symbols are laid out back to back on one axis.
+    buy_quantity = np.where(is_buy, quantity, 0.0)
+    sell_quantity = np.where(is_sell, quantity, 0.0)
+    bought_total = np.bincount(symbol, weights=buy_quantity, minlength=n_symbols)
+    sold_total = np.bincount(symbol, weights=sell_quantity, minlength=n_symbols)
+
+    cum_bought = np.cumsum(buy_quantity)
+    cum_cost = np.cumsum(inflow)
+    symbol_base = (cum_bought - buy_quantity)[symbol_start]
+    points = is_buy & (quantity > 0)
+    units_axis = np.r_[0.0, cum_bought[points]]
+    cost_axis = np.r_[0.0, cum_cost[points]]
+
+    sold_after = _grouped_cumsum(sell_quantity, symbol_start)
+    sold_before = sold_after - sell_quantity
+    row_base, row_bought = symbol_base[symbol], bought_total[symbol]
+    fifo_removed = (
+        np.interp(row_base + np.minimum(sold_after, row_bought), units_axis, cost_axis)
+        - np.interp(row_base + np.minimum(sold_before, row_bought), units_axis, cost_axis)
+    )
+    fifo_realized = np.bincount(symbol, weights=np.where(is_sell, proceeds - fifo_removed, 0.0), minlength=n_symbols)
+    fifo_cost_basis = (
+        np.interp(symbol_base + bought_total, units_axis, cost_axis)
+        - np.interp(symbol_base + np.minimum(sold_total, bought_total), units_axis, cost_axis)
+    )
+
+    open_quantity = held_after[symbol_last]
+    trade_counts = np.bincount(symbol, minlength=n_symbols)
+    has_position = open_quantity > EPSILON
+    safe_quantity = np.where(has_position, open_quantity, 1.0)
+    avg_price = np.where(has_position, avg_cost_basis / safe_quantity, 0.0)
+    fifo_price = np.where(has_position, fifo_cost_basis / safe_quantity, 0.0)
+
+    return [
+        {
+            "stockName": str(cols.names[i]),
+            "currency": cols.currencies[i],
+            "trades": int(trade_counts[i]),
+            "openQuantity": _round(open_quantity[i]),
+            "boughtQuantity": _round(bought_total[i]),
+            "soldQuantity": _round(sold_total[i]),
+            "averageCost": {
+                "costBasis": _round(avg_cost_basis[i]),
+                "averagePrice": _round(avg_price[i]),
+                "realizedPnl": _round(avg_realized[i])
+            },
+            "fifo": {
+                "costBasis": _round(fifo_cost_basis[i]),
+                "averagePrice": _round(fifo_price[i]),
+                "realizedPnl": _round(fifo_realized[i])
+            }
+        }
+        for i in range(n_symbols)
+    ]
+
+
+def _round(value):
+    return round(float(value), 8) + 0.0
@@ -0,0 +1,67 @@
+import copy
+import json
+import zlib
+from decimal import Decimal
+
+
+class InMemoryTable:
+    """Minimal local stand-in for a boto3 DynamoDB Table in tests.
+
+    Supports the calls the scan engine relies on: put_item, get_item and
+    scan with Limit, ExclusiveStartKey, Segment/TotalSegments and
+    ReturnConsumedCapacity. Anything else, e.g. FilterExpression or
+    ProjectionExpression, raises rather than being silently ignored.
+    """
+
+    def __init__(self, name, key_names, page_size=100):
+        self.name = name
+        self.key_names = tuple(key_names)
+        self.page_size = page_size
+        self.items = {}
+        self.scan_calls = 0
+
+    def _key(self, item):
+        return tuple(item[k] for k in self.key_names)
+
+    def _segment(self, item, total_segments):
+        partition_key = str(item[self.key_names[0]]).encode()
+        return zlib.crc32(partition_key) % total_segments
+
+    def put_item(self, Item, **kwargs):
+        self.items[self._key(Item)] = copy.deepcopy(Item)
+        return {}
+
+    def get_item(self, Key, **kwargs):
+        item = self.items.get(self._key(Key))
+        return {"Item": copy.deepcopy(item)} if item is not None else {}
+
+    def scan(self, Limit=None, ExclusiveStartKey=None, Segment=None, TotalSegments=None,
+             ReturnConsumedCapacity=None, **kwargs):
+        if kwargs:
+            raise NotImplementedError(f"InMemoryTable.scan does not support {', '.join(sorted(kwargs))}")
+        self.scan_calls += 1
+        keys = sorted(self.items, key=str)
+        if TotalSegments:
+            keys = [k for k in keys if self._segment(self.items[k], TotalSegments) == Segment]
+        if ExclusiveStartKey:
+            start = self._key(ExclusiveStartKey)
+            keys = [k for k in keys if str(k) > str(start)]
+
+        limit = Limit or self.page_size
+        page = [copy.deepcopy(self.items[k]) for k in keys[:limit]]
+        response = {"Items": page, "Count": len(page), "ScannedCount": len(page)}
+        if len(keys) > limit:
+            response["LastEvaluatedKey"] = {k: page[-1][k] for k in self.key_names}
+        if ReturnConsumedCapacity:
+            size = sum(len(json.dumps(item, default=str)) for item in page)
+            response["ConsumedCapacity"] = {
+                "TableName": self.name,
+                "CapacityUnits": max(0.5, size / 4096 * 0.5)
+            }
+        return response
+
+
+def load_items(table, items):
+    for item in items:
+        table.put_item(Item={k: Decimal(str(v)) if isinstance(v, float) else v for k, v in item.items()})
+    return table
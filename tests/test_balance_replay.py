@@ -0,0 +1,73 @@
+import os
+import sys
+from decimal import Decimal
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "walletManagement"))
+
+import balance_stream  # noqa: E402
+from replay import InMemoryWalletsClient, replay, stream_record  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def no_version_bumps(monkeypatch):
+    # Version counters live in DynamoDB; they are not what is tested here.
+    monkeypatch.setattr(balance_stream.versions, "bump", lambda *args: None)
+
+
+WALLETS = [
+    {"walletId": "cash", "userId": "u1", "balance": 100},
+    {"walletId": "bank", "userId": "u1", "balance": 0},
+]
+
+
+def transaction(trans_id, amount, from_wallet=None, to_wallet=None, fee=0):
+    return {
+        "transId": trans_id, "userId": "u1", "tdate": "2024-01-01", "amount": amount,
+        "fee": fee, "fromWallet": from_wallet, "toWallet": to_wallet
+    }
+
+
+def test_replay_follows_inserts_modifies_and_removes():
+    salary = transaction("t1", 1000, to_wallet="bank")
+    transfer = transaction("t2", 200, from_wallet="bank", to_wallet="cash", fee=1)
+    coffee = transaction("t3", 4, from_wallet="cash")
+    changes = [
+        (None, salary),
+        (None, transfer),
+        (None, coffee),
+        (coffee, dict(coffee, amount=5)),
+        (transfer, None),
+    ]
+
+    balances = replay(changes, WALLETS)
+
+    assert balances == {("cash", "u1"): Decimal(95), ("bank", "u1"): Decimal(1000)}
+
+
+def test_redelivered_records_do_not_change_balances_again():
+    # Streams deliver at least once; a retried batch must leave the same
+    # balances as a single delivery.
+    changes = [
+        (None, transaction("t1", 50, from_wallet="cash", to_wallet="bank")),
+        (None, transaction("t2", 10, to_wallet="cash", fee=Decimal("0.5"))),
+    ]
+    records = [stream_record(old, new, i) for i, (old, new) in enumerate(changes, start=1)]
+    client = InMemoryWalletsClient(WALLETS)
+
+    assert balance_stream.apply_records(records, client) == {"batchItemFailures": []}
+    once = dict(client.balances)
+    assert balance_stream.apply_records(records, client) == {"batchItemFailures": []}
+
+    assert client.balances == once == {("cash", "u1"): Decimal("59.5"), ("bank", "u1"): Decimal(50)}
+
+
+def test_transactions_on_missing_wallets_only_update_the_others():
+    changes = [(None, transaction("t1", 30, from_wallet="closed", to_wallet="bank"))]
+
+    balances = replay(changes, WALLETS)
+
+    assert balances == {("cash", "u1"): Decimal(100), ("bank", "u1"): Decimal(30)}
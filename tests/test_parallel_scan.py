@@ -0,0 +1,77 @@
+import itertools
+import json
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.parallel_scan import SEGMENT_DONE, parallel_scan  # noqa: E402
+from local_dynamodb import InMemoryTable, load_items  # noqa: E402
+
+
+def stock_table(count, page_size=25):
+    table = InMemoryTable("Stocks", ("stockId", "userId"), page_size=page_size)
+    return load_items(table, ({"stockId": f"s-{i:04d}", "userId": f"u-{i % 7}", "price": i * 1.5} for i in range(count)))
+
+
+class RecordingTable:
+    def __init__(self, table):
+        self.table = table
+        self.calls = []
+
+    def scan(self, **kwargs):
+        self.calls.append(kwargs)
+        return self.table.scan(**kwargs)
+
+
+def test_segments_cover_every_item_once():
+    table = RecordingTable(stock_table(500))
+
+    items = list(parallel_scan(table, total_segments=4))
+
+    assert sorted(item["stockId"] for item in items) == [f"s-{i:04d}" for i in range(500)]
+    assert {call["Segment"] for call in table.calls} == {0, 1, 2, 3}
+    assert {call["TotalSegments"] for call in table.calls} == {4}
+
+
+def test_resumes_from_progress_after_a_json_round_trip():
+    table = stock_table(500)
+    progress = {}
+
+    scan = parallel_scan(table, total_segments=4, progress=progress)
+    first = [item["stockId"] for item in itertools.islice(scan, 180)]
+    scan.close()
+    progress = json.loads(json.dumps(progress))
+    calls_before = table.scan_calls
+    rest = [item["stockId"] for item in parallel_scan(table, total_segments=4, progress=progress)]
+
+    assert set(first) | set(rest) == {f"s-{i:04d}" for i in range(500)}
+    # Only pages the consumer had not finished are read again.
+    assert len(first) + len(rest) - 500 < 4 * table.page_size
+    assert table.scan_calls - calls_before < 500 // table.page_size + 4
+    assert progress == {str(segment): SEGMENT_DONE for segment in range(4)}
+    assert list(parallel_scan(table, total_segments=4, progress=progress)) == []
+
+
+def test_throttles_to_max_read_capacity():
+    # One ~16 KB item per page costs about 2 units, so 30 pages are about
+    # 60 units: 40 from the full bucket, the rest at 40 units per second.
+    table = InMemoryTable("Stocks", ("stockId", "userId"), page_size=1)
+    load_items(table, ({"stockId": f"s-{i:02d}", "userId": "u", "blob": "x" * 16384} for i in range(30)))
+
+    started = time.monotonic()
+    items = list(parallel_scan(table, total_segments=3, max_read_capacity=40))
+    elapsed = time.monotonic() - started
+
+    assert len(items) == 30
+    assert elapsed >= 0.3
+
+
+def test_segment_errors_reach_the_consumer():
+    table = InMemoryTable("Stocks", ("stockId", "userId"))
+
+    with pytest.raises(NotImplementedError):
+        list(parallel_scan(table, total_segments=2, FilterExpression="userId = :u"))
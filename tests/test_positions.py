@@ -0,0 +1,126 @@
+import os
+import random
+import sys
+from collections import deque
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "stockManagement"))
+
+from positions import compute_positions  # noqa: E402
+
+
+def reference_positions(trades):
+    """Row-by-row average cost and FIFO per symbol, for comparison."""
+    result = {}
+    for trade in sorted(trades, key=lambda t: (t["stockName"], t["tdate"], t["stockId"])):
+        state = result.setdefault(trade["stockName"], {
+            "held": 0.0, "avgCost": 0.0, "avgPnl": 0.0, "lots": deque(), "fifoPnl": 0.0
+        })
+        quantity, price, fee = float(trade["quantity"]), float(trade["price"]), float(trade["fee"])
+        if trade["side"] == "buy":
+            state["held"] += quantity
+            state["avgCost"] += quantity * price + fee
+            state["lots"].append([quantity, (quantity * price + fee) / quantity])
+            continue
+
+        proceeds = quantity * price - fee
+        ratio = (state["held"] - quantity) / state["held"]
+        state["avgPnl"] += proceeds - state["avgCost"] * (1 - ratio)
+        state["avgCost"] *= ratio
+        state["held"] -= quantity
+
+        removed, remaining = 0.0, quantity
+        while remaining > 1e-12:
+            lot = state["lots"][0]
+            used = min(lot[0], remaining)
+            removed += used * lot[1]
+            lot[0] -= used
+            remaining -= used
+            if lot[0] <= 1e-12:
+                state["lots"].popleft()
+        state["fifoPnl"] += proceeds - removed
+    return result
+
+
+def random_trades(count, symbols, seed=7):
+    rng = random.Random(seed)
+    held = {}
+    trades = []
+    for i in range(count):
+        name = f"SYM{rng.randrange(symbols):03d}"
+        position = held.get(name, 0.0)
+        if position > 0 and rng.random() < 0.6:
+            # Some sells close the position; most sell nearly all of it,
+            # which drives a running product of sell ratios toward zero.
+            quantity = position if rng.random() < 0.05 else round(position * rng.uniform(0.5, 0.99999), 6)
+            side = "sell"
+            held[name] = position - quantity
+        else:
+            quantity = round(rng.uniform(0.5, 200), 6)
+            side = "buy"
+            held[name] = position + quantity
+        trades.append({
+            "stockId": f"s-{i:05d}",
+            "stockName": name,
+            "tdate": f"2020-01-01T00:00:{i:05d}",
+            "side": side,
+            "quantity": quantity,
+            "price": round(rng.uniform(1, 5000), 2),
+            "fee": round(rng.uniform(0, 10), 2),
+            "currency": "USD"
+        })
+    return trades
+
+
+def test_matches_row_by_row_reference_over_long_histories():
+    trades = random_trades(1000, 90)
+    expected = reference_positions(trades)
+    positions = {p["stockName"]: p for p in compute_positions(trades)}
+
+    assert set(positions) == set(expected)
+    for name, state in expected.items():
+        position = positions[name]
+        assert position["openQuantity"] == pytest.approx(state["held"], rel=1e-9, abs=1e-6)
+        assert position["averageCost"]["costBasis"] == pytest.approx(state["avgCost"], rel=1e-9, abs=1e-6)
+        assert position["averageCost"]["realizedPnl"] == pytest.approx(state["avgPnl"], rel=1e-9, abs=1e-6)
+        assert position["fifo"]["realizedPnl"] == pytest.approx(state["fifoPnl"], rel=1e-9, abs=1e-6)
+
+
+def test_closing_sell_starts_a_new_average_cost_cycle():
+    trades = [
+        {"stockId": "1", "stockName": "A", "tdate": "2024-01-01", "side": "buy", "quantity": 10, "price": 10, "fee": 0},
+        {"stockId": "2", "stockName": "A", "tdate": "2024-01-02", "side": "sell", "quantity": 10, "price": 12, "fee": 0},
+        {"stockId": "3", "stockName": "A", "tdate": "2024-01-03", "side": "buy", "quantity": 5, "price": 20, "fee": 0},
+    ]
+    [position] = compute_positions(trades)
+
+    assert position["averageCost"] == {"costBasis": 100.0, "averagePrice": 20.0, "realizedPnl": 20.0}
+
+
+def test_partial_sell_keeps_the_average_price():
+    trades = [
+        {"stockId": "1", "stockName": "A", "tdate": "2024-01-01", "side": "buy", "quantity": 10, "price": 10, "fee": 0},
+        {"stockId": "2", "stockName": "A", "tdate": "2024-01-02", "side": "buy", "quantity": 10, "price": 20, "fee": 0},
+        {"stockId": "3", "stockName": "A", "tdate": "2024-01-03", "side": "sell", "quantity": 5, "price": 30, "fee": 0},
+    ]
+    [position] = compute_positions(trades)
+
+    assert position["openQuantity"] == 15.0
+    assert position["averageCost"] == {"costBasis": 225.0, "averagePrice": 15.0, "realizedPnl": 75.0}
+    assert position["fifo"] == {"costBasis": 250.0, "averagePrice": 16.66666667, "realizedPnl": 100.0}
+
+
+def test_sells_down_to_zero_leave_no_cost():
+    trades = [
+        {"stockId": "1", "stockName": "A", "tdate": "2024-01-01", "side": "buy", "quantity": 10, "price": 10, "fee": 0},
+        {"stockId": "2", "stockName": "A", "tdate": "2024-01-02", "side": "sell", "quantity": 4, "price": 15, "fee": 0},
+        {"stockId": "3", "stockName": "A", "tdate": "2024-01-03", "side": "sell", "quantity": 6, "price": 5, "fee": 0},
+        {"stockId": "4", "stockName": "B", "tdate": "2024-01-01", "side": "buy", "quantity": 2, "price": 50, "fee": 1},
+    ]
+    first, second = compute_positions(trades)
+
+    assert first["openQuantity"] == 0.0
+    assert first["averageCost"] == {"costBasis": 0.0, "averagePrice": 0.0, "realizedPnl": -10.0}
+    assert first["fifo"] == {"costBasis": 0.0, "averagePrice": 0.0, "realizedPnl": -10.0}
+    assert second["averageCost"] == {"costBasis": 101.0, "averagePrice": 50.5, "realizedPnl": 0.0}
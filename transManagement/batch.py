@@ -0,0 +1,79 @@
+import logging
+import time
+from decimal import Decimal, InvalidOperation
+from botocore.exceptions import ClientError
+from common.batching import MAX_ATTEMPTS, RETRYABLE_ERRORS, WRITE_CHUNK_SIZE, backoff, batch_get_items, chunked
+
+logger = logging.getLogger()
+
+KEY_FIELDS = ("transId", "userId")
+# tdate is the sort key of the sparse userId-tdate-index.
+REQUIRED_FIELDS = KEY_FIELDS + ("tdate",)
+
+
+def validate_item(item):
+    """Returns (item, error). Floats from the JSON body become Decimal,
+    which is what DynamoDB accepts for numbers."""
+    if not isinstance(item, dict):
+        return None, "Item must be a JSON object"
+    missing = [field for field in REQUIRED_FIELDS if not isinstance(item.get(field), str) or not item.get(field)]
+    if missing:
+        return None, f"Missing required fields: {', '.join(missing)}"
+
+    clean = {}
+    for key, value in item.items():
+        if isinstance(value, float):
+            value = Decimal(str(value))
+        clean[key] = value
+    amount = clean.get("amount")
+    if amount not in (None, ""):
+        try:
+            Decimal(str(amount))
+        except InvalidOperation:
+            return None, f"amount is not a number: {amount}"
+    return clean, None
+
+
+def item_key(item):
+    return tuple(item[field] for field in KEY_FIELDS)
+
+
+def get_existing(dynamodb, table_name, items, sleep=time.sleep):
+    """Reads the items a batch is about to overwrite, keyed by (transId,
+    userId), so their old values can be reversed out of the rollups."""
+    keys = [{field: item[field] for field in KEY_FIELDS} for item in items]
+    return {item_key(found): found for found in batch_get_items(dynamodb, table_name, keys, sleep)}
+
+
+def write_items(dynamodb, table_name, items, sleep=time.sleep):
+    """Writes `items` with BatchWriteItem in 25-item chunks, retrying
+    unprocessed items with jittered exponential backoff. Returns
+    {index: error message} for the items that could not be written."""
+    failures = {}
+    for chunk in chunked(list(enumerate(items)), WRITE_CHUNK_SIZE):
+        pending = {item_key(item): index for index, item in chunk}
+        requests = [{"PutRequest": {"Item": item}} for _, item in chunk]
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                response = dynamodb.batch_write_item(RequestItems={table_name: requests})
+            except ClientError as e:
+                code = e.response.get("Error", {}).get("Code")
+                if code not in RETRYABLE_ERRORS:
+                    for index in pending.values():
+                        failures[index] = e.response.get("Error", {}).get("Message") or code
+                    pending = {}
+                    break
+                logger.warning("Batch write to %s throttled (%s), attempt %d", table_name, code, attempt + 1)
+                backoff(attempt, sleep)
+                continue
+
+            requests = response.get("UnprocessedItems", {}).get(table_name, [])
+            unprocessed = {item_key(r["PutRequest"]["Item"]) for r in requests}
+            pending = {key: index for key, index in pending.items() if key in unprocessed}
+            if not requests:
+                break
+            backoff(attempt, sleep)
+
+        for index in pending.values():
+            failures[index] = f"Not processed after {MAX_ATTEMPTS} attempts"
+    return failures
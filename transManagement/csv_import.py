@@ -0,0 +1,242 @@
+import csv
+import hashlib
+import re
+from collections import Counter
+from datetime import datetime
+from decimal import Decimal
+
+# Bank-statement CSV import. Every stage is a generator, so rows flow from
+# the source lines to the batched writer one batch at a time; beyond the
+# batch, only a short key per distinct row is kept, to number repeats.
+
+# Transaction field -> accepted header names (compared case-insensitively).
+DEFAULT_COLUMNS = {
+    "tdate": ("date", "transaction date", "booking date", "posting date", "value date", "tdate"),
+    "amount": ("amount", "value", "transaction amount"),
+    "currency": ("currency", "ccy"),
+    "transType": ("type", "transaction type", "transtype"),
+    "mainCat": ("category", "main category", "maincat"),
+    "note": ("description", "details", "memo", "payee", "narrative", "note"),
+    "fromWallet": ("from wallet", "fromwallet"),
+    "toWallet": ("to wallet", "towallet"),
+}
+DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%m/%d/%Y", "%d.%m.%Y", "%Y/%m/%d", "%d-%m-%Y")
+DEFAULT_CATEGORY = "Uncategorized"
+EXPENSE_TYPE = "Expense"
+INCOME_TYPE = "Income"
+BATCH_SIZE = 500
+MAX_REPORTED_ERRORS = 1000
+
+# A whole amount cell: optional parentheses for a negative amount, one
+# optional sign, one optional currency code or symbol before or after the
+# number, and the number with optional thousands groups before the
+# decimal mark. Anything else in the cell (exponents, "DR"/"CR" suffixes,
+# a second sign) makes the amount invalid rather than being dropped.
+CURRENCY = r"(?:[A-Z]{3}|[$€£¥])"
+AMOUNT_PATTERN = (
+    r"(?P<open>\()?\s*(?P<sign>[-+])?\s*(?:(?P<prefix>{currency})\s*)?(?P<inner_sign>[-+])?"
+    r"(?P<number>(?:\d{{1,3}}(?:{group}\d{{3}})+|\d+)(?:{decimal}\d+)?|{decimal}\d+)"
+    r"\s*(?P<suffix>{currency})?\s*(?P<close>\))?"
+)
+# Decimal comma flag -> (pattern, group mark, decimal mark).
+AMOUNTS = {
+    decimal_comma: (
+        re.compile(
+            AMOUNT_PATTERN.format(currency=CURRENCY, group=re.escape(group), decimal=re.escape(decimal)), re.ASCII
+        ),
+        group,
+        decimal,
+    )
+    for decimal_comma, group, decimal in ((False, ",", "."), (True, ".", ","))
+}
+
+
+class RowError(ValueError):
+    pass
+
+
+def resolve_columns(fieldnames, mapping=None):
+    """Returns {transaction field: CSV header} for the headers present.
+    Explicit `mapping` entries win over the default aliases."""
+    headers = {name.strip().lower(): name for name in fieldnames or () if name}
+    columns = {}
+    for field, aliases in DEFAULT_COLUMNS.items():
+        for alias in aliases:
+            if alias in headers:
+                columns[field] = headers[alias]
+                break
+    for field, header in (mapping or {}).items():
+        if header not in (fieldnames or ()):
+            raise RowError(f"Mapped column '{header}' for {field} is not in the CSV header")
+        columns[field] = header
+    missing = [field for field in ("tdate", "amount") if field not in columns]
+    if missing:
+        raise RowError(f"No column found for {', '.join(missing)}")
+    return columns
+
+
+def parse_amount(text, decimal_comma=False):
+    """Parses statement amounts such as "-1,234.56", "1.234,56" (with
+    `decimal_comma`), "(12.00)", "EUR 12" or "-12.00 €" into a Decimal.
+    The whole cell must match the amount grammar, and an amount written in
+    the other convention, e.g. "12,50" without `decimal_comma`, is rejected
+    rather than misread."""
+    text = (text or "").strip()
+    pattern, group_mark, decimal_mark = AMOUNTS[decimal_comma]
+    match = pattern.fullmatch(text)
+    if not match:
+        if AMOUNTS[not decimal_comma][0].fullmatch(text):
+            hint = "without" if decimal_comma else "with"
+            raise RowError(f"Invalid amount: {text!r} (import {hint} decimalComma?)")
+        raise RowError(f"Invalid amount: {text!r}")
+    if (
+        bool(match["open"]) != bool(match["close"])
+        or (match["sign"] and match["inner_sign"])
+        or (match["prefix"] and match["suffix"])
+    ):
+        raise RowError(f"Invalid amount: {text!r}")
+
+    amount = Decimal(match["number"].replace(group_mark, "").replace(decimal_mark, "."))
+    negative = bool(match["open"]) != ("-" in (match["sign"], match["inner_sign"]))
+    return -amount if negative else amount
+
+
+def parse_date(text, date_format=None):
+    text = (text or "").strip()
+    for fmt in (date_format,) if date_format else DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            continue
+    raise RowError(f"Invalid date: {text!r}")
+
+
+def transaction_id(user_id, item, occurrence):
+    # Derived from the row's content only, so re-importing a statement, or
+    # one that overlaps an earlier import, overwrites the rows already
+    # there. `occurrence` numbers identical rows within the file (1, 2, ...)
+    # so genuine repeats, e.g. two coffees on the same day, stay distinct.
+    parts = (user_id, item["tdate"], str(item["amount"]), item.get("transType"), item.get("note") or "", str(occurrence))
+    return "imp-" + hashlib.sha1("\x1f".join(parts).encode()).hexdigest()[:24]
+
+
+def map_row(row, columns, user_id, wallet=None, currency=None, date_format=None, decimal_comma=False):
+    """Turns one CSV row into a transaction item. The amount is stored
+    unsigned: negative rows become expenses paid from `wallet`, positive
+    rows income received into it, unless the CSV has a type column."""
+    def value(field):
+        header = columns.get(field)
+        return (row.get(header) or "").strip() if header else ""
+
+    signed = parse_amount(value("amount"), decimal_comma)
+    trans_type = value("transType") or (EXPENSE_TYPE if signed < 0 else INCOME_TYPE)
+    item = {
+        "userId": user_id,
+        "tdate": parse_date(value("tdate"), date_format),
+        "amount": abs(signed),
+        "transType": trans_type,
+        "mainCat": value("mainCat") or DEFAULT_CATEGORY,
+    }
+    item_currency = value("currency") or currency
+    if item_currency:
+        item["currency"] = item_currency
+    if value("note"):
+        item["note"] = value("note")
+
+    from_wallet = value("fromWallet")
+    to_wallet = value("toWallet")
+    if not from_wallet and not to_wallet and wallet:
+        if signed < 0 or trans_type == EXPENSE_TYPE:
+            from_wallet = wallet
+        else:
+            to_wallet = wallet
+    if from_wallet:
+        item["fromWallet"] = from_wallet
+    if to_wallet:
+        item["toWallet"] = to_wallet
+    return item
+
+
+def parse_rows(lines, user_id, mapping=None, **options):
+    """Yields (row number, item, error) for every data row of the CSV in
+    `lines`, an iterable of text lines. Row numbers count the header as 1."""
+    reader = csv.DictReader(lines)
+    columns = resolve_columns(reader.fieldnames, mapping)
+    occurrences = Counter()
+    for row in reader:
+        row_number = reader.line_num
+        if not any((value or "").strip() for value in row.values() if isinstance(value, str)):
+            continue
+        try:
+            item = map_row(row, columns, user_id, **options)
+        except RowError as e:
+            yield row_number, None, str(e)
+            continue
+        content = (item["tdate"], str(item["amount"]), item["transType"], item.get("note"))
+        occurrences[content] += 1
+        item["transId"] = transaction_id(user_id, item, occurrences[content])
+        yield row_number, item, None
+
+
+def capped(rows, limit):
+    """Returns the rows as a list, raising RowError as soon as there are
+    more than `limit`, so an oversized statement is refused before anything
+    is written while its source is only read once."""
+    buffered = []
+    for row in rows:
+        if len(buffered) >= limit:
+            raise RowError(f"At most {limit} rows per import")
+        buffered.append(row)
+    return buffered
+
+
+def batched(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def import_rows(rows, write_batch, batch_size=BATCH_SIZE, max_reported_errors=MAX_REPORTED_ERRORS):
+    """Drives the pipeline: `rows` from parse_rows are written through
+    `write_batch(items)`, which returns {index in batch: error}. Returns a
+    report with counts and the first `max_reported_errors` row errors."""
+    report = {"rows": 0, "imported": 0, "failed": 0, "errors": [], "errorsTruncated": False}
+
+    def record_error(row_number, error):
+        report["failed"] += 1
+        if len(report["errors"]) < max_reported_errors:
+            report["errors"].append({"row": row_number, "error": error})
+        else:
+            report["errorsTruncated"] = True
+
+    for batch in batched(rows, batch_size):
+        report["rows"] += len(batch)
+        valid = []
+        for row_number, item, error in batch:
+            if error:
+                record_error(row_number, error)
+            else:
+                valid.append((row_number, item))
+        if not valid:
+            continue
+        failures = write_batch([item for _, item in valid])
+        for index, (row_number, _) in enumerate(valid):
+            if index in failures:
+                record_error(row_number, failures[index])
+            else:
+                report["imported"] += 1
+    return report
+
+
+def decoded_lines(chunks, encoding="utf-8-sig"):
+    """Decodes an iterable of byte lines (e.g. an S3 StreamingBody's
+    iter_lines()) into newline-terminated text lines for csv.DictReader, so
+    quoted fields spanning lines keep their line breaks."""
+    for chunk in chunks:
+        line = chunk.decode(encoding) if isinstance(chunk, bytes) else chunk
+        yield line if line.endswith("\n") else line + "\n"
@@ -1,15 +1,53 @@
-import boto3
-import json
+import batch
+import csv_import
+import io
 import logging
-from custom_encoder import CustomEncoder
-from decimal import Decimal
+import re
+import rollups
+from common import versions
+from common.apigateway import build_response
+from common.log import log_event
+from common.pagination import decode_cursor, encode_cursor, parse_limit, read_page
+from common.projection import parse_fields, projection
+from common.router import Router
+from common.runtime import get_client, get_resource, lazy_table, mark_invocation
+from common.updates import apply_update, build_update, split_fields
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.exceptions import ClientError
 
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
 
 dynamodbTableName = "Transactions"
-dynamodb = boto3.resource("dynamodb")
-table = dynamodb.Table(dynamodbTableName)
+table = lazy_table(dynamodbTableName)
+summaryTableName = "TransactionSummaries"
+summary_table = lazy_table(summaryTableName)
+
+# Attributes a client may ask for with ?fields=; the keys are always returned.
+FIELDS = {"tdate", "transType", "mainCat", "amount", "currency", "fee", "fromWallet", "toWallet", "note"}
+# A PATCH with an empty string removes these; other fields keep their value.
+CLEARABLE_FIELDS = {"fromWallet", "toWallet", "note"}
+# The attributes the monthly rollups are computed from.
+ROLLUP_FIELDS = {"tdate", "amount", "currency", "transType", "mainCat"}
+
+# GSI with userId as partition key and tdate as sort key. Tables created
+# before the index existed fall back to a filtered scan. The index is
+# sparse, so every write must leave the item with a tdate or
+# GET /transactions would not list it.
+USER_INDEX_NAME = "userId-tdate-index"
+user_index_available = None
+
+DEFAULT_PAGE_LIMIT = 100
+MAX_PAGE_LIMIT = 1000
+MAX_BATCH_ITEMS = 1000
+# POST /transactions/import runs inside API Gateway's 29 s integration
+# timeout; each 500-row batch costs a BatchGet, 20 BatchWrites and the
+# rollup updates, so larger statements are refused before anything is
+# written. They are imported by s3_import.py from an S3 upload instead.
+MAX_IMPORT_ROWS = 5000
+
+# tdate values are ISO-8601 strings, so date ranges compare lexicographically.
+DATE_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}(T[0-9:.]+)?$")
+END_OF_DAY = "T23:59:59.999999"
 
 GET_METHOD = "GET"
 POST_METHOD = "POST"
@@ -18,83 +56,146 @@ DELETE_METHOD = "DELETE"
 HEALTH_PATH = "/healthT"
 TRANSACTION_PATH = "/transaction"
 TRANSACTIONS_PATH = "/transactions"
+SUMMARY_PATH = "/transactions/summary"
+REBUILD_SUMMARY_PATH = "/transactions/summary/rebuild"
+BATCH_PATH = "/transactions/batch"
+IMPORT_PATH = "/transactions/import"
+
+router = Router()
 
 def lambda_handler(event, context):
-    logger.info(f"Received event: {event}")    
-    http_method = event["httpMethod"]
-    _path = event.get("path", "")
-    _stage = (event.get("requestContext") or {}).get("stage")
-    if _stage and _path.startswith("/" + _stage + "/"):
-        _path = _path[len(_stage) + 1:]
-    elif _stage and _path == "/" + _stage:
-        _path = "/"
-    path = event.get("resource") or _path
-    
-    try:
-        if http_method == GET_METHOD and path == HEALTH_PATH:
-            response = build_response(200, {"status": "Healthy"})
-            
-        elif http_method == GET_METHOD and path == TRANSACTION_PATH:
-            query_params = event.get("queryStringParameters", {})
-            trans_id = query_params.get("transId")
-            user_id = query_params.get("userId")
-
-            if not trans_id or not user_id:
-                response = build_response(400, {"Message": "transId and userId are required"})
-            else:
-                response = get_transaction(trans_id, user_id)
-            
-        elif http_method == GET_METHOD and path == TRANSACTIONS_PATH:
-            response = get_transactions()
-            
-        elif http_method == POST_METHOD and path == TRANSACTION_PATH:
-            response = save_transaction(json.loads(event["body"]))
-   
-        elif http_method == PATCH_METHOD and path == TRANSACTION_PATH:
-            request_body = json.loads(event["body"])
-            trans_id = request_body.get("transId")
-            user_id = request_body.get("userId")
-            trans_type = request_body.get("transType")
-            main_cat = request_body.get("mainCat")
-            tdate = request_body.get("tdate")
-            amount = request_body.get("amount")
-            from_wallet = request_body.get("fromWallet")
-            to_wallet = request_body.get("toWallet")
-            currency = request_body.get("currency")
-            fee = request_body.get("fee")
-            note = request_body.get("note")
-
-            if not trans_id or not user_id:
-                response = build_response(400, {"Message": "Missing required fields for updating transaction"})
-            else:
-                response = modify_transaction(trans_id, user_id, trans_type, main_cat, tdate, amount, from_wallet, to_wallet, currency, fee, note)
-        
-        elif http_method == DELETE_METHOD and path == TRANSACTION_PATH:
-            request_body = json.loads(event["body"])
-            trans_id = request_body.get("transId")
-            user_id = request_body.get("userId")
-            
-            if not trans_id or not user_id:
-                response = build_response(400, {"Message": "transId and userId are required"})
-            else:
-                response = delete_transaction(trans_id, user_id)
-        
-        else:
-            response = build_response(404, {"Message": "Path not found"})
-    except Exception as e:
-        logger.exception("Error processing request")
-        return build_response(500, {"Message": f"Internal server error: {str(e)}"})
-    return response
+    log_event(logger, event, context)
+    mark_invocation()
+    return router.dispatch(event, context)
+
+@router.route(GET_METHOD, HEALTH_PATH)
+def handle_health(request):
+    return build_response(200, {"status": "Healthy"})
+
+@router.route(GET_METHOD, TRANSACTION_PATH)
+def handle_get_transaction(request):
+    trans_id = request.query.get("transId")
+    user_id = request.query.get("userId")
+
+    if not trans_id or not user_id:
+        return build_response(400, {"Message": "transId and userId are required"})
+    return get_transaction(trans_id, user_id, parse_fields(request, FIELDS, batch.KEY_FIELDS))
+
+@router.route(GET_METHOD, TRANSACTIONS_PATH)
+def handle_get_transactions(request):
+    user_id = request.query.get("userId")
+    cursor = request.query.get("cursor")
+    date_from = request.query.get("from")
+    date_to = request.query.get("to")
+
+    if not user_id:
+        return build_response(400, {"Message": "Missing required parameter: userId"})
+    if any(d and not DATE_PATTERN.match(d) for d in (date_from, date_to)):
+        return build_response(400, {"Message": "from and to must be ISO dates (YYYY-MM-DD)"})
+    limit = parse_limit(request.query.get("limit"), DEFAULT_PAGE_LIMIT, MAX_PAGE_LIMIT)
+    if limit is None:
+        return build_response(400, {"Message": f"limit must be between 1 and {MAX_PAGE_LIMIT}"})
+    fields = parse_fields(request, FIELDS, batch.KEY_FIELDS)
+    etag, not_modified = versions.conditional_get(request, user_id, versions.TRANSACTIONS)
+    if not_modified:
+        return not_modified
+    return get_transactions(user_id, limit, cursor, date_from, date_to, etag, fields)
+
+@router.route(GET_METHOD, SUMMARY_PATH)
+def handle_get_summary(request):
+    user_id = request.query.get("userId")
+    month_from = request.query.get("from")
+    month_to = request.query.get("to")
+
+    if not user_id:
+        return build_response(400, {"Message": "Missing required parameter: userId"})
+    if any(m and not rollups.MONTH_PATTERN.match(m) for m in (month_from, month_to)):
+        return build_response(400, {"Message": "from and to must be months (YYYY-MM)"})
+    return get_summary(user_id, month_from, month_to)
+
+@router.route(POST_METHOD, REBUILD_SUMMARY_PATH)
+def handle_rebuild_summary(request):
+    user_id = request.body.get("userId")
+
+    if not user_id:
+        return build_response(400, {"Message": "Missing required field: userId"})
+    return rebuild_summary(user_id)
+
+@router.route(POST_METHOD, TRANSACTION_PATH)
+def handle_save_transaction(request):
+    return save_transaction(request.body)
+
+@router.route(POST_METHOD, BATCH_PATH)
+def handle_save_transactions(request):
+    items = request.body.get("transactions")
 
-def get_transaction(trans_id, user_id):
+    if not isinstance(items, list) or not items:
+        return build_response(400, {"Message": "transactions must be a non-empty list"})
+    if len(items) > MAX_BATCH_ITEMS:
+        return build_response(400, {"Message": f"At most {MAX_BATCH_ITEMS} transactions per batch"})
+    return save_transactions(items)
+
+@router.route(POST_METHOD, IMPORT_PATH)
+def handle_import_transactions(request):
+    body = request.body
+    user_id = body.get("userId")
+    source = body.get("s3")
+    mapping = body.get("mapping")
+
+    if not user_id:
+        return build_response(400, {"Message": "Missing required field: userId"})
+    if mapping is not None and not isinstance(mapping, dict):
+        return build_response(400, {"Message": "mapping must map transaction fields to CSV column names"})
+    if isinstance(source, dict) and source.get("bucket") and source.get("key"):
+        # Statements can be uploaded to S3 first and streamed line by line.
+        try:
+            s3_object = get_client("s3").get_object(Bucket=source["bucket"], Key=source["key"])
+        except ClientError as e:
+            logger.warning("Cannot read s3://%s/%s: %s", source["bucket"], source["key"], e)
+            return build_response(400, {"Message": f"Cannot read s3://{source['bucket']}/{source['key']}"})
+        lines = csv_import.decoded_lines(s3_object["Body"].iter_lines())
+    elif isinstance(body.get("csv"), str):
+        lines = io.StringIO(body["csv"], newline="")
+    else:
+        return build_response(400, {"Message": "Provide the statement as csv text or an s3 bucket and key"})
+
+    return import_transactions(user_id, lines, {
+        "mapping": mapping,
+        "wallet": body.get("wallet"),
+        "currency": body.get("currency"),
+        "date_format": body.get("dateFormat"),
+        "decimal_comma": bool(body.get("decimalComma"))
+    }, MAX_IMPORT_ROWS)
+
+@router.route(PATCH_METHOD, TRANSACTION_PATH)
+def handle_modify_transaction(request):
+    body = request.body
+    trans_id = body.get("transId")
+    user_id = body.get("userId")
+
+    if not trans_id or not user_id:
+        return build_response(400, {"Message": "Missing required fields for updating transaction"})
+    return modify_transaction(trans_id, user_id, {k: v for k, v in body.items() if k in FIELDS})
+
+@router.route(DELETE_METHOD, TRANSACTION_PATH)
+def handle_delete_transaction(request):
+    trans_id = request.body.get("transId")
+    user_id = request.body.get("userId")
+
+    if not trans_id or not user_id:
+        return build_response(400, {"Message": "transId and userId are required"})
+    return delete_transaction(trans_id, user_id)
+
+def get_transaction(trans_id, user_id, fields=None):
     try:
-        logger.info(f"Fetching transaction with Key: {{'transId': {trans_id}, 'userId': '{user_id}'}}")
+        logger.info("Fetching transaction with Key: %s", {"transId": trans_id, "userId": user_id})
 
         response = table.get_item(
             Key={
                 "transId": trans_id,
                 "userId": user_id
-            }
+            },
+            **projection(fields)
         )
 
         if "Item" in response:
@@ -105,23 +206,105 @@ def get_transaction(trans_id, user_id):
         logger.exception("Error retrieving transaction")
         return build_response(500, {"Message": "Error retrieving transaction"})
 
-def get_transactions():
+def get_transactions(user_id, limit=DEFAULT_PAGE_LIMIT, cursor=None, date_from=None, date_to=None, etag=None, fields=None):
     try:
-        response = table.scan()
-        result = response["Items"]
+        start_key = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        return build_response(400, {"Message": "Invalid cursor"})
 
-        while "LastEvaluatedKey" in response:
-            response = table.scan(ExclusiveStartKey=response["LastEvaluatedKey"])
-            result.extend(response["Items"])
-
-        return build_response(200, {"transactions": result})
+    try:
+        items, last_key = query_user_transactions(user_id, limit, start_key, date_from, date_to, fields)
+        return build_response(200, {
+            "transactions": items,
+            "nextCursor": encode_cursor(last_key) if last_key else None
+        }, etag=etag)
     except Exception as e:
         logger.exception("Error retrieving transactions")
         return build_response(500, {"Message": "Error retrieving transactions"})
 
+def query_user_transactions(user_id, limit, start_key=None, date_from=None, date_to=None, fields=None):
+    global user_index_available
+
+    if date_to and "T" not in date_to:
+        date_to += END_OF_DAY
+
+    if user_index_available is not False:
+        key_condition = Key("userId").eq(user_id)
+        if date_from and date_to:
+            key_condition &= Key("tdate").between(date_from, date_to)
+        elif date_from:
+            key_condition &= Key("tdate").gte(date_from)
+        elif date_to:
+            key_condition &= Key("tdate").lte(date_to)
+
+        try:
+            page = read_page(
+                table.query,
+                limit,
+                start_key,
+                IndexName=USER_INDEX_NAME,
+                KeyConditionExpression=key_condition,
+                **projection(fields)
+            )
+            user_index_available = True
+            return page
+        except ClientError as e:
+            if not is_missing_index_error(e):
+                raise
+            logger.warning("Index %s not found on %s, falling back to scan", USER_INDEX_NAME, dynamodbTableName)
+            user_index_available = False
+
+    filter_expression = Attr("userId").eq(user_id)
+    if date_from:
+        filter_expression &= Attr("tdate").gte(date_from)
+    if date_to:
+        filter_expression &= Attr("tdate").lte(date_to)
+    return read_page(table.scan, limit, start_key, FilterExpression=filter_expression, **projection(fields))
+
+def is_missing_index_error(error):
+    err = error.response.get("Error", {})
+    return err.get("Code") == "ValidationException" and "index" in err.get("Message", "").lower()
+
+def get_summary(user_id, month_from=None, month_to=None):
+    try:
+        result = rollups.get_summary(summary_table, user_id, month_from, month_to)
+        return build_response(200, {"summary": result})
+    except Exception as e:
+        logger.exception("Error retrieving transaction summary")
+        return build_response(500, {"Message": "Error retrieving transaction summary"})
+
+def rebuild_summary(user_id):
+    try:
+        months = rollups.rebuild_rollups(summary_table, user_id, iter_user_transactions(user_id, ROLLUP_FIELDS))
+        return build_response(200, {"Operation": "REBUILD", "Message": "SUCCESS", "months": months})
+    except Exception as e:
+        logger.exception("Error rebuilding transaction summary")
+        return build_response(500, {"Message": "Error rebuilding transaction summary"})
+
+def iter_user_transactions(user_id, fields=None):
+    start_key = None
+    while True:
+        items, start_key = query_user_transactions(user_id, MAX_PAGE_LIMIT, start_key, fields=fields)
+        yield from items
+        if not start_key:
+            return
+
+def update_rollups(user_id, old_item, new_item):
+    # The transaction write has already succeeded; a failed rollup update is
+    # logged rather than turned into an error for the client.
+    try:
+        rollups.apply_change(summary_table, user_id, old_item, new_item)
+    except Exception as e:
+        logger.exception("Error updating monthly rollups for userId: %s", user_id)
+
 def save_transaction(request_body):
     try:
-        table.put_item(Item=request_body)
+        if not request_body.get("tdate"):
+            return build_response(400, {"Message": "Missing required field: tdate"})
+
+        response = table.put_item(Item=request_body, ReturnValues="ALL_OLD")
+        update_rollups(request_body.get("userId"), response.get("Attributes"), request_body)
+        versions.bump(request_body.get("userId"), versions.TRANSACTIONS)
         return build_response(200, {
             "Operation": "SAVE",
             "Message": "SUCCESS",
@@ -131,36 +314,107 @@ def save_transaction(request_body):
         logger.exception("Error saving transaction")
         return build_response(500, {"Message": "Error saving transaction"})
 
-def modify_transaction(trans_id, user_id, trans_type, main_cat, tdate, amount, from_wallet, to_wallet, currency, fee, note):
-    try:    
-        update_expression = """SET transType = :transType, mainCat = :mainCat, tdate = :tdate, fromWallet = :fromWallet,
-          toWallet = :toWallet, amount = :amount, currency = :currency, fee = :fee, note = :note"""
-        expression_attribute_values = {
-            ":transType": trans_type,
-            ":mainCat": main_cat,
-            ":tdate": tdate,
-            ":amount": amount,
-            ":fromWallet": from_wallet,
-            ":toWallet": to_wallet,
-            ":currency": currency,
-            ":fee": fee,
-            ":note": note
-        }
-        
+def save_transactions(items):
+    results = [None] * len(items)
+    indexes = []
+    to_write = []
+    seen = set()
+    for index, item in enumerate(items):
+        clean, error = batch.validate_item(item)
+        if clean is not None and batch.item_key(clean) in seen:
+            error = "Duplicate transId and userId in batch"
+        if error:
+            results[index] = {"index": index, "status": "FAILED", "error": error}
+            continue
+        seen.add(batch.item_key(clean))
+        indexes.append(index)
+        to_write.append(clean)
+
+    try:
+        failures = store_items(to_write)
+    except Exception as e:
+        logger.exception("Error saving transaction batch")
+        return build_response(500, {"Message": "Error saving transaction batch"})
+
+    for position, (index, item) in enumerate(zip(indexes, to_write)):
+        result = {"index": index, "transId": item["transId"], "status": "SAVED"}
+        if position in failures:
+            result.update(status="FAILED", error=failures[position])
+        results[index] = result
+
+    saved = len(to_write) - len(failures)
+    return build_response(200 if saved == len(items) else 207, {
+        "Operation": "BATCH_SAVE",
+        "Message": "SUCCESS" if saved == len(items) else "PARTIAL",
+        "saved": saved,
+        "failed": len(items) - saved,
+        "results": results
+    })
+
+def store_items(items):
+    """Writes validated items with batched writes and folds the written
+    ones into the monthly rollups. Returns {index: error} for failures."""
+    if not items:
+        return {}
+    dynamodb = get_resource()
+    existing = batch.get_existing(dynamodb, dynamodbTableName, items)
+    failures = batch.write_items(dynamodb, dynamodbTableName, items)
+
+    changes = [
+        (existing.get(batch.item_key(item)), item)
+        for index, item in enumerate(items) if index not in failures
+    ]
+    try:
+        rollups.apply_changes(summary_table, changes)
+    except Exception as e:
+        logger.exception("Error updating monthly rollups for transaction batch")
+    for user_id in {item["userId"] for _, item in changes}:
+        versions.bump(user_id, versions.TRANSACTIONS)
+    return failures
+
+def import_transactions(user_id, lines, options, max_rows=None):
+    try:
+        rows = csv_import.parse_rows(lines, user_id, **options)
+        if max_rows is not None:
+            rows = csv_import.capped(rows, max_rows)
+        report = csv_import.import_rows(rows, store_items)
+    except csv_import.RowError as e:
+        return build_response(400, {"Message": str(e)})
+    except Exception as e:
+        logger.exception("Error importing transactions")
+        return build_response(500, {"Message": "Error importing transactions"})
+
+    logger.info("Imported %d of %d rows for userId %s", report["imported"], report["rows"], user_id)
+    return build_response(200 if not report["failed"] else 207, {
+        "Operation": "IMPORT",
+        "Message": "SUCCESS" if not report["failed"] else "PARTIAL",
+        **report
+    })
+
+def modify_transaction(trans_id, user_id, fields):
+    try:
+        set_fields, remove_fields = split_fields(fields, CLEARABLE_FIELDS)
+        if not set_fields and not remove_fields:
+            return build_response(400, {"Message": "No fields to update"})
+
+        key = {"transId": trans_id, "userId": user_id}
         response = table.update_item(
-            Key={
-                "transId": trans_id,
-                "userId": user_id
-            },
-            UpdateExpression=update_expression,
-            ExpressionAttributeValues=expression_attribute_values,
-            ReturnValues="UPDATED_NEW"
+            Key=key, ReturnValues="ALL_OLD", **build_update(set_fields, remove_fields, required=("tdate",))
         )
+        old_item = response.get("Attributes")
+        update_rollups(user_id, old_item, apply_update(old_item, key, set_fields, remove_fields))
+        versions.bump(user_id, versions.TRANSACTIONS)
+
         return build_response(200, {
             "Operation": "UPDATE",
             "Message": "SUCCESS",
-            "UpdatedAttributes": response["Attributes"]
+            "UpdatedAttributes": set_fields
         })
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") == "ConditionalCheckFailedException":
+            return build_response(400, {"Message": "Missing required field: tdate"})
+        logger.exception("Error updating transaction")
+        return build_response(500, {"Message": "Error updating transaction"})
     except Exception as e:
         logger.exception("Error updating transaction")
         return build_response(500, {"Message": "Error updating transaction"})
@@ -175,6 +429,8 @@ def delete_transaction(trans_id, user_id):
             ReturnValues="ALL_OLD"
         )
         if "Attributes" in response:
+            update_rollups(user_id, response["Attributes"], None)
+            versions.bump(user_id, versions.TRANSACTIONS)
             return build_response(200, {
                 "Operation": "DELETE",
                 "Message": "SUCCESS",
@@ -185,16 +441,3 @@ def delete_transaction(trans_id, user_id):
     except Exception as e:
         logger.exception("Error deleting transaction")
         return build_response(500, {"Message": "Error deleting transaction"})
-
-
-def build_response(status_code, body=None):
-    response = {
-        "statusCode": status_code,
-        "headers": {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": "*"
-        }
-    }
-    if body is not None:
-        response["body"] = json.dumps(body, cls=CustomEncoder)
-    return response
@@ -0,0 +1,154 @@
+import logging
+import re
+from decimal import Decimal, InvalidOperation
+from boto3.dynamodb.conditions import Key
+
+logger = logging.getLogger()
+
+MONTH_PATTERN = re.compile(r"^\d{4}-\d{2}$")
+# Attributes are csum#<currency>#<transType>#<mainCat> and the matching
+# ccount#..., so amounts in different currencies are never added together.
+SUM_PREFIX = "csum#"
+COUNT_PREFIX = "ccount#"
+
+
+def to_decimal(value):
+    if value is None or value == "":
+        return Decimal(0)
+    try:
+        return Decimal(str(value))
+    except InvalidOperation:
+        logger.warning("Ignoring non-numeric amount: %s", value)
+        return Decimal(0)
+
+
+def rollup_deltas(item, sign=1):
+    """Maps (month, currency, transType, mainCat) to [amount delta, count
+    delta] for one transaction. `sign=-1` gives the reverse delta."""
+    if not item:
+        return {}
+    month = str(item.get("tdate") or "")[:7]
+    if not MONTH_PATTERN.match(month):
+        return {}
+    key = (month, item.get("currency") or "", item.get("transType") or "", item.get("mainCat") or "")
+    return {key: [sign * to_decimal(item.get("amount")), sign]}
+
+
+def merge_deltas(*delta_maps):
+    merged = {}
+    for deltas in delta_maps:
+        for key, (amount, count) in deltas.items():
+            entry = merged.setdefault(key, [Decimal(0), 0])
+            entry[0] += amount
+            entry[1] += count
+    return {key: value for key, value in merged.items() if value[0] or value[1]}
+
+
+def apply_deltas(summary_table, user_id, deltas):
+    by_month = {}
+    for (month, currency, trans_type, main_cat), values in deltas.items():
+        by_month.setdefault(month, []).append((f"{currency}#{trans_type}#{main_cat}", values))
+
+    for month, categories in by_month.items():
+        add_clauses = []
+        names = {}
+        values = {}
+        for i, (category, (amount, count)) in enumerate(categories):
+            add_clauses.append(f"#s{i} :s{i}, #c{i} :c{i}")
+            names[f"#s{i}"] = SUM_PREFIX + category
+            names[f"#c{i}"] = COUNT_PREFIX + category
+            values[f":s{i}"] = amount
+            values[f":c{i}"] = count
+
+        summary_table.update_item(
+            Key={"userId": user_id, "month": month},
+            UpdateExpression="ADD " + ", ".join(add_clauses),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values
+        )
+
+
+def apply_change(summary_table, user_id, old_item=None, new_item=None):
+    """Applies the rollup delta for a transaction changing from `old_item`
+    to `new_item`. Either side may be None for inserts and deletes."""
+    apply_deltas(summary_table, user_id, merge_deltas(rollup_deltas(old_item, sign=-1), rollup_deltas(new_item)))
+
+
+def apply_changes(summary_table, changes):
+    """Applies many (old_item, new_item) changes with one update per user
+    and month, for batch writes."""
+    by_user = {}
+    for old_item, new_item in changes:
+        user_id = (new_item or old_item)["userId"]
+        by_user.setdefault(user_id, []).extend((rollup_deltas(old_item, sign=-1), rollup_deltas(new_item)))
+    for user_id, delta_maps in by_user.items():
+        apply_deltas(summary_table, user_id, merge_deltas(*delta_maps))
+
+
+def get_summary(summary_table, user_id, month_from=None, month_to=None):
+    """Months in range with per-currency category sums and counts; totals
+    are per currency, then per transType."""
+    key_condition = Key("userId").eq(user_id)
+    if month_from and month_to:
+        key_condition &= Key("month").between(month_from, month_to)
+    elif month_from:
+        key_condition &= Key("month").gte(month_from)
+    elif month_to:
+        key_condition &= Key("month").lte(month_to)
+
+    months = (format_month(item) for item in get_summary_items(summary_table, key_condition))
+    return [month for month in months if month["categories"]]
+
+
+def get_summary_items(summary_table, key_condition):
+    response = summary_table.query(KeyConditionExpression=key_condition)
+    items = response["Items"]
+    while "LastEvaluatedKey" in response:
+        response = summary_table.query(
+            ExclusiveStartKey=response["LastEvaluatedKey"],
+            KeyConditionExpression=key_condition
+        )
+        items.extend(response["Items"])
+    return items
+
+
+def format_month(item):
+    categories = []
+    totals = {}
+    for name, amount in item.items():
+        if not name.startswith(SUM_PREFIX):
+            continue
+        category = name[len(SUM_PREFIX):]
+        count = item.get(COUNT_PREFIX + category, 0)
+        if not count:
+            continue
+        currency, trans_type, main_cat = category.split("#", 2)
+        categories.append({
+            "currency": currency, "transType": trans_type, "mainCat": main_cat, "sum": amount, "count": count
+        })
+        by_type = totals.setdefault(currency, {})
+        by_type[trans_type] = by_type.get(trans_type, Decimal(0)) + amount
+
+    categories.sort(key=lambda c: (c["currency"], c["transType"], c["mainCat"]))
+    return {"month": item["month"], "categories": categories, "totals": totals}
+
+
+def rebuild_rollups(summary_table, user_id, transactions):
+    """Recomputes a user's rollups from their full transaction history, for
+    backfilling transactions written before the rollups existed or
+    repairing them after a failed incremental update."""
+    deltas = merge_deltas(*(rollup_deltas(item) for item in transactions))
+    months = {}
+    for (month, currency, trans_type, main_cat), (amount, count) in deltas.items():
+        item = months.setdefault(month, {"userId": user_id, "month": month})
+        item[f"{SUM_PREFIX}{currency}#{trans_type}#{main_cat}"] = amount
+        item[f"{COUNT_PREFIX}{currency}#{trans_type}#{main_cat}"] = count
+
+    existing = get_summary_items(summary_table, Key("userId").eq(user_id))
+    with summary_table.batch_writer() as batch:
+        for item in existing:
+            if item["month"] not in months:
+                batch.delete_item(Key={"userId": user_id, "month": item["month"]})
+        for item in months.values():
+            batch.put_item(Item=item)
+    return len(months)
@@ -0,0 +1,86 @@
+import csv_import
+import json
+import logging
+import lambda_function
+from urllib.parse import unquote_plus
+from common.log import set_request_context
+from common.runtime import get_client, mark_invocation
+
+logger = logging.getLogger()
+
+# Imports statements of any size, without POST /transactions/import's row
+# cap. Deployed as its own function (handler s3_import.lambda_handler) with
+# a timeout sized for large files, triggered by s3:ObjectCreated:* on the
+# statement bucket filtered to the imports/ prefix and .csv suffix. The key
+# names the user: imports/<userId>/<file>.csv. Import options come from the
+# object's user metadata: wallet, currency, dateformat, decimalcomma and
+# mapping (a JSON object). Transaction ids are derived from row content, so
+# a retried event overwrites what an earlier attempt wrote. The report is
+# written to import-reports/<userId>/<file>.json, outside the trigger prefix.
+IMPORT_PREFIX = "imports/"
+REPORT_PREFIX = "import-reports/"
+TRUE_VALUES = ("1", "true", "yes")
+
+
+def lambda_handler(event, context):
+    set_request_context(event, context)
+    records = event.get("Records", [])
+    logger.info("Received %d S3 records", len(records))
+    mark_invocation()
+    for record in records:
+        s3 = record.get("s3", {})
+        import_object(s3["bucket"]["name"], unquote_plus(s3["object"]["key"]))
+
+
+def parse_key(key):
+    """Returns (userId, file name) for imports/<userId>/<file>, else (None, None)."""
+    if not key.startswith(IMPORT_PREFIX):
+        return None, None
+    user_id, _, name = key[len(IMPORT_PREFIX):].partition("/")
+    if not user_id or not name:
+        return None, None
+    return user_id, name
+
+
+def import_options(metadata):
+    mapping = metadata.get("mapping")
+    if mapping:
+        try:
+            mapping = json.loads(mapping)
+        except ValueError:
+            raise csv_import.RowError("mapping metadata must be a JSON object")
+        if not isinstance(mapping, dict):
+            raise csv_import.RowError("mapping metadata must be a JSON object")
+    return {
+        "mapping": mapping or None,
+        "wallet": metadata.get("wallet"),
+        "currency": metadata.get("currency"),
+        "date_format": metadata.get("dateformat"),
+        "decimal_comma": (metadata.get("decimalcomma") or "").lower() in TRUE_VALUES
+    }
+
+
+def import_object(bucket, key, s3_client=None):
+    user_id, name = parse_key(key)
+    if not user_id:
+        logger.warning("Skipping s3://%s/%s: not under %s<userId>/", bucket, key, IMPORT_PREFIX)
+        return None
+
+    s3_client = s3_client or get_client("s3")
+    s3_object = s3_client.get_object(Bucket=bucket, Key=key)
+    try:
+        options = import_options(s3_object.get("Metadata") or {})
+        rows = csv_import.parse_rows(csv_import.decoded_lines(s3_object["Body"].iter_lines()), user_id, **options)
+        report = {"status": "COMPLETE", **csv_import.import_rows(rows, lambda_function.store_items)}
+    except (csv_import.RowError, UnicodeDecodeError) as e:
+        report = {"status": "FAILED", "error": str(e)}
+    # Other errors propagate, so the asynchronous invocation is retried.
+
+    logger.info("Import of s3://%s/%s for userId %s: %s", bucket, key, user_id, report["status"])
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=f"{REPORT_PREFIX}{user_id}/{name.rpartition('.')[0] or name}.json",
+        Body=json.dumps({"source": key, **report}).encode(),
+        ContentType="application/json"
+    )
+    return report
@@ -0,0 +1,136 @@
+import logging
+from decimal import Decimal, InvalidOperation
+from botocore.exceptions import ClientError
+from common import versions
+from common.log import set_request_context
+from common.runtime import get_client, mark_invocation
+
+logger = logging.getLogger()
+
+# Consumes the Transactions table stream (StreamViewType NEW_AND_OLD_IMAGES)
+# and keeps Wallets.balance in step with the money movements.
+# Only typed low-level calls are needed, so no boto3 resource is created.
+walletsTableName = "Wallets"
+
+
+def lambda_handler(event, context):
+    set_request_context(event, context)
+    logger.info("Received %d stream records", len(event.get("Records", [])))
+    mark_invocation()
+    return apply_records(event.get("Records", []))
+
+
+def apply_records(records, dynamodb_client=None):
+    dynamodb_client = dynamodb_client or get_client()
+    for index, record in enumerate(records):
+        try:
+            apply_record(record, dynamodb_client)
+        except Exception:
+            # Report this record and everything after it so the stream
+            # retries them in order; earlier records are not re-applied.
+            logger.exception("Error applying stream record %s", record.get("eventID"))
+            return {"batchItemFailures": [
+                {"itemIdentifier": r["dynamodb"]["SequenceNumber"]} for r in records[index:]
+            ]}
+    return {"batchItemFailures": []}
+
+
+def apply_record(record, dynamodb_client):
+    images = record.get("dynamodb", {})
+    deltas = merge_deltas(
+        wallet_deltas(images.get("OldImage"), sign=-1),
+        wallet_deltas(images.get("NewImage"))
+    )
+    if deltas:
+        write_deltas(dynamodb_client, deltas, record.get("eventID"))
+        for user_id in {user_id for _, user_id in deltas}:
+            versions.bump(user_id, versions.WALLETS)
+    return deltas
+
+
+def wallet_deltas(image, sign=1):
+    """Maps (walletId, userId) to the balance change one transaction causes:
+    fromWallet pays amount plus fee, toWallet receives amount."""
+    deltas = {}
+    if not image or "userId" not in image:
+        return deltas
+
+    user_id = image["userId"]["S"]
+    amount = number(image.get("amount"))
+    fee = number(image.get("fee"))
+    from_wallet = string(image.get("fromWallet"))
+    to_wallet = string(image.get("toWallet"))
+
+    def add(wallet_id, value):
+        if wallet_id and value:
+            key = (wallet_id, user_id)
+            deltas[key] = deltas.get(key, Decimal(0)) + sign * value
+
+    if from_wallet:
+        add(from_wallet, -(amount + fee))
+        add(to_wallet, amount)
+    else:
+        add(to_wallet, amount - fee)
+    return deltas
+
+
+def merge_deltas(*delta_maps):
+    merged = {}
+    for deltas in delta_maps:
+        for key, value in deltas.items():
+            merged[key] = merged.get(key, Decimal(0)) + value
+    return {key: value for key, value in merged.items() if value}
+
+
+def write_deltas(dynamodb_client, deltas, token=None):
+    # All wallets touched by one transaction change together. Wallets that
+    # no longer exist are dropped and the rest is retried.
+    pending = dict(deltas)
+    while pending:
+        keys = list(pending)
+        kwargs = {
+            "TransactItems": [
+                {"Update": {
+                    "TableName": walletsTableName,
+                    "Key": {"walletId": {"S": wallet_id}, "userId": {"S": user_id}},
+                    "UpdateExpression": "ADD balance :delta",
+                    "ConditionExpression": "attribute_exists(walletId)",
+                    "ExpressionAttributeValues": {":delta": {"N": str(pending[(wallet_id, user_id)])}}
+                }}
+                for wallet_id, user_id in keys
+            ]
+        }
+        if token:
+            kwargs["ClientRequestToken"] = f"{token}-{len(keys)}"[:36]
+        try:
+            dynamodb_client.transact_write_items(**kwargs)
+            return
+        except ClientError as e:
+            reasons = e.response.get("CancellationReasons") or []
+            missing = [
+                key for key, reason in zip(keys, reasons)
+                if reason.get("Code") == "ConditionalCheckFailed"
+            ]
+            if e.response.get("Error", {}).get("Code") != "TransactionCanceledException" or not missing:
+                raise
+            for key in missing:
+                logger.warning("Wallet %s for userId: %s not found, balance not updated", key[0], key[1])
+                del pending[key]
+
+
+def number(attribute):
+    # Amounts may be stored as numbers or as numeric strings.
+    value = (attribute or {}).get("N") or (attribute or {}).get("S")
+    if not value:
+        return Decimal(0)
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        logger.warning("Ignoring non-numeric amount: %s", value)
+        return Decimal(0)
+
+
+def string(attribute):
+    if not attribute:
+        return None
+    return attribute.get("S")
@@ -1,16 +1,27 @@
-import boto3
-import json
 import logging
-from custom_encoder import CustomEncoder
-from decimal import Decimal
+from common import versions
+from common.apigateway import build_response
+from common.log import log_event
+from common.projection import parse_fields, projection
+from common.router import Router
+from common.runtime import lazy_table, mark_invocation
+from common.updates import build_update, split_fields
 from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
 
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
 
 dynamodbTableName = "Wallets"
-dynamodb = boto3.resource("dynamodb")
-table = dynamodb.Table(dynamodbTableName)
+table = lazy_table(dynamodbTableName)
+
+# Attributes a client may ask for with ?fields=; the keys are always returned.
+KEY_FIELDS = ("walletId", "userId")
+FIELDS = {"walletName", "walletType", "accountNumber", "balance", "currency", "color", "note"}
+# balance is kept in step with the wallet's transactions by balance_stream.py;
+# a client may only set it as the opening balance of a new wallet.
+WRITABLE_FIELDS = FIELDS - {"balance"}
+# A PATCH with an empty string removes these; other fields keep their value.
+CLEARABLE_FIELDS = {"accountNumber", "color", "note"}
 
 GET_METHOD = "GET"
 POST_METHOD = "POST"
@@ -20,83 +31,70 @@ HEALTH_PATH = "/health"
 WALLET_PATH = "/wallet"
 WALLETS_PATH = "/wallets"
 
-def lambda_handler(event, context):
-    logger.info(f"Received event: {event}")
-    http_method = event["httpMethod"]
-    _path = event.get("path", "")
-    _stage = (event.get("requestContext") or {}).get("stage")
-    if _stage and _path.startswith("/" + _stage + "/"):
-        _path = _path[len(_stage) + 1:]
-    elif _stage and _path == "/" + _stage:
-        _path = "/"
-    path = event.get("resource") or _path
-
-    try:
-        if http_method == GET_METHOD and path == HEALTH_PATH:
-            response = build_response(200, {"status": "Healthy"})
-
-        elif http_method == GET_METHOD and path == WALLET_PATH:
-            query_params = event.get("queryStringParameters", {})
-            wallet_id = query_params.get("walletId")
-            user_id = query_params.get("userId")
-
-            if not wallet_id or not user_id:
-                response = build_response(400, {"Message": "walletId and userId are required"})
-            else:
-                response = get_wallet(wallet_id, user_id)
-
-        elif http_method == GET_METHOD and path == WALLETS_PATH:
-            query_params = event.get("queryStringParameters", {})
-            user_id = query_params.get("userId")
-            if not user_id:
-                response = build_response(400, {"Message": "Missing required parameter: username"})
-            else:
-                response = get_wallets(user_id)
-
-        elif http_method == POST_METHOD and path == WALLET_PATH:
-            response = save_wallet(json.loads(event["body"]))
-
-        elif http_method == PATCH_METHOD and path == WALLET_PATH:
-            request_body = json.loads(event["body"])
-            wallet_id = request_body.get("walletId")
-            user_id = request_body.get("userId")
-            currency = request_body.get("currency")
-            wallet_name = request_body.get("walletName")
-            wallet_type = request_body.get("walletType")
-            account_number = request_body.get("accountNumber")
-            balance = request_body.get("balance")
-            note = request_body.get("note")
-            color = request_body.get("color")
-
-            if not wallet_id or not user_id:
-                response = build_response(400, {"Message": "Missing required fields for updating wallet"})
-            else:
-                response = modify_wallet(wallet_id, user_id, currency, wallet_name, wallet_type, account_number, balance, note, color)
-
-        elif http_method == DELETE_METHOD and path == WALLET_PATH:
-            request_body = json.loads(event["body"])
-            wallet_id = request_body.get("walletId")
-            user_id = request_body.get("userId")
-
-            if not wallet_id or not user_id:
-                response = build_response(400, {"Message": "walletId and userId are required for deletion"})
-            else:
-                response = delete_wallet(wallet_id, user_id)
-
-        else:
-            response = build_response(404, {"Message": "Path not found"})
-    except Exception as e:
-        logger.exception("Error processing request")
-        response = build_response(500, {"Message": "Internal server error"})
-    return response
+router = Router(error_detail=False)
 
-def get_wallet(wallet_id, user_id):
+def lambda_handler(event, context):
+    log_event(logger, event, context)
+    mark_invocation()
+    return router.dispatch(event, context)
+
+@router.route(GET_METHOD, HEALTH_PATH)
+def handle_health(request):
+    return build_response(200, {"status": "Healthy"})
+
+@router.route(GET_METHOD, WALLET_PATH)
+def handle_get_wallet(request):
+    wallet_id = request.query.get("walletId")
+    user_id = request.query.get("userId")
+
+    if not wallet_id or not user_id:
+        return build_response(400, {"Message": "walletId and userId are required"})
+    return get_wallet(wallet_id, user_id, parse_fields(request, FIELDS, KEY_FIELDS))
+
+@router.route(GET_METHOD, WALLETS_PATH)
+def handle_get_wallets(request):
+    user_id = request.query.get("userId")
+    if not user_id:
+        return build_response(400, {"Message": "Missing required parameter: username"})
+    fields = parse_fields(request, FIELDS, KEY_FIELDS)
+    etag, not_modified = versions.conditional_get(request, user_id, versions.WALLETS)
+    if not_modified:
+        return not_modified
+    return get_wallets(user_id, etag, fields)
+
+@router.route(POST_METHOD, WALLET_PATH)
+def handle_save_wallet(request):
+    return save_wallet(request.body)
+
+@router.route(PATCH_METHOD, WALLET_PATH)
+def handle_modify_wallet(request):
+    body = request.body
+    wallet_id = body.get("walletId")
+    user_id = body.get("userId")
+
+    if not wallet_id or not user_id:
+        return build_response(400, {"Message": "Missing required fields for updating wallet"})
+    if "balance" in body:
+        return build_response(400, {"Message": "balance follows the wallet's transactions and cannot be updated"})
+    return modify_wallet(wallet_id, user_id, {k: v for k, v in body.items() if k in WRITABLE_FIELDS})
+
+@router.route(DELETE_METHOD, WALLET_PATH)
+def handle_delete_wallet(request):
+    wallet_id = request.body.get("walletId")
+    user_id = request.body.get("userId")
+
+    if not wallet_id or not user_id:
+        return build_response(400, {"Message": "walletId and userId are required for deletion"})
+    return delete_wallet(wallet_id, user_id)
+
+def get_wallet(wallet_id, user_id, fields=None):
     try:
         response = table.get_item(
             Key={
                 "walletId": wallet_id,
                 "userId": user_id
-            }
+            },
+            **projection(fields)
         )
         if "Item" in response:
             return build_response(200, response["Item"])
@@ -106,64 +104,66 @@ def get_wallet(wallet_id, user_id):
         logger.exception("Error retrieving wallet")
         return build_response(500, {"Message": "Error retrieving wallet"})
 
-def get_wallets(user_id):
+def get_wallets(user_id, etag=None, fields=None):
     try:
         response = table.scan(
-            FilterExpression=Attr('userId').eq(user_id)
+            FilterExpression=Attr('userId').eq(user_id),
+            **projection(fields)
         )
         result = response["Items"]
 
         while "LastEvaluatedKey" in response:
             response = table.scan(
                 ExclusiveStartKey=response["LastEvaluatedKey"],
-                FilterExpression=Attr('userId').eq(user_id)
+                FilterExpression=Attr('userId').eq(user_id),
+                **projection(fields)
             )
             result.extend(response["Items"])
 
-        return build_response(200, {"wallets": result})
+        return build_response(200, {"wallets": result}, etag=etag)
     except Exception as e:
         logger.exception("Error retrieving wallets")
         return build_response(500, {"Message": "Error retrieving wallets"})
 
 def save_wallet(request_body):
     try:
-        table.put_item(Item=request_body)
+        # Only creates: replacing an existing wallet would reset the balance
+        # the transaction stream maintains. Changes go through PATCH.
+        table.put_item(Item=request_body, ConditionExpression=Attr("walletId").not_exists())
+        versions.bump(request_body.get("userId"), versions.WALLETS)
         return build_response(200, {
             "Operation": "SAVE",
             "Message": "SUCCESS",
             "Item": request_body
         })
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") == "ConditionalCheckFailedException":
+            return build_response(409, {"Message": "Wallet already exists; use PATCH to change it"})
+        logger.exception("Error saving wallet")
+        return build_response(500, {"Message": "Error saving wallet"})
     except Exception as e:
         logger.exception("Error saving wallet")
         return build_response(500, {"Message": "Error saving wallet"})
 
-def modify_wallet(wallet_id, user_id, currency, wallet_name, wallet_type, account_number, balance, note, color):
+def modify_wallet(wallet_id, user_id, fields):
     try:
-        update_expression = """SET currency = :currency, walletName = :walletName, walletType = :walletType, 
-        accountNumber = :accountNumber, balance = :balance, note = :note, color = :color"""
-        expression_attribute_values = {
-            ":currency": currency,
-            ":walletName": wallet_name,
-            ":walletType": wallet_type,
-            ":accountNumber": account_number,
-            ":balance": balance,
-            ":note": note,
-            ":color": color
-        }
+        set_fields, remove_fields = split_fields(fields, CLEARABLE_FIELDS)
+        if not set_fields and not remove_fields:
+            return build_response(400, {"Message": "No fields to update"})
 
         response = table.update_item(
             Key={
                 "walletId": wallet_id,
                 "userId": user_id
             },
-            UpdateExpression=update_expression,
-            ExpressionAttributeValues=expression_attribute_values,
-            ReturnValues="UPDATED_NEW"
+            ReturnValues="UPDATED_NEW",
+            **build_update(set_fields, remove_fields)
         )
+        versions.bump(user_id, versions.WALLETS)
         return build_response(200, {
             "Operation": "UPDATE",
             "Message": "SUCCESS",
-            "UpdatedAttributes": response["Attributes"]
+            "UpdatedAttributes": response.get("Attributes", {})
         })
     except Exception as e:
         logger.exception("Error updating wallet")
@@ -179,6 +179,7 @@ def delete_wallet(wallet_id, user_id):
             ReturnValues="ALL_OLD"
         )
         if "Attributes" in response:
+            versions.bump(user_id, versions.WALLETS)
             return build_response(200, {
                 "Operation": "DELETE",
                 "Message": "SUCCESS",
@@ -189,15 +190,3 @@ def delete_wallet(wallet_id, user_id):
     except Exception as e:
         logger.exception("Error deleting wallet")
         return build_response(500, {"Message": "Error deleting wallet"})
-
-def build_response(status_code, body=None):
-    response = {
-        "statusCode": status_code,
-        "headers": {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": "*"
-        }
-    }
-    if body is not None:
-        response["body"] = json.dumps(body, cls=CustomEncoder)
-    return response
@@ -0,0 +1,88 @@
+import uuid
+from decimal import Decimal
+from botocore.exceptions import ClientError
+
+import balance_stream
+
+# Local harness for the balance stream consumer: turns transaction changes
+# into DynamoDB stream records and applies them to in-memory wallets, so
+# balance materialization can be exercised without AWS.
+
+
+class InMemoryWalletsClient:
+    """Implements the transact_write_items subset balance_stream uses."""
+
+    def __init__(self, wallets=()):
+        self.balances = {}
+        self.tokens = set()
+        for wallet in wallets:
+            self.balances[(wallet["walletId"], wallet["userId"])] = Decimal(str(wallet.get("balance") or 0))
+
+    def transact_write_items(self, TransactItems, ClientRequestToken=None):
+        if ClientRequestToken in self.tokens:
+            return {}
+
+        updates = []
+        reasons = []
+        for entry in TransactItems:
+            update = entry["Update"]
+            key = (update["Key"]["walletId"]["S"], update["Key"]["userId"]["S"])
+            exists = key in self.balances
+            reasons.append({"Code": "None" if exists else "ConditionalCheckFailed"})
+            updates.append((key, Decimal(update["ExpressionAttributeValues"][":delta"]["N"])))
+
+        if any(reason["Code"] != "None" for reason in reasons):
+            raise ClientError(
+                {
+                    "Error": {"Code": "TransactionCanceledException", "Message": "Transaction cancelled"},
+                    "CancellationReasons": reasons
+                },
+                "TransactWriteItems"
+            )
+
+        for key, delta in updates:
+            self.balances[key] += delta
+        if ClientRequestToken:
+            self.tokens.add(ClientRequestToken)
+        return {}
+
+
+def to_image(item):
+    if item is None:
+        return None
+    image = {}
+    for key, value in item.items():
+        if value is None:
+            continue
+        if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+            image[key] = {"N": str(value)}
+        else:
+            image[key] = {"S": str(value)}
+    return image
+
+
+def stream_record(old_item=None, new_item=None, sequence_number=None):
+    if old_item is None:
+        event_name = "INSERT"
+    elif new_item is None:
+        event_name = "REMOVE"
+    else:
+        event_name = "MODIFY"
+
+    images = {"SequenceNumber": str(sequence_number or uuid.uuid4().int)}
+    if old_item is not None:
+        images["OldImage"] = to_image(old_item)
+    if new_item is not None:
+        images["NewImage"] = to_image(new_item)
+    return {"eventID": uuid.uuid4().hex, "eventName": event_name, "dynamodb": images}
+
+
+def replay(changes, wallets):
+    """Applies (old_item, new_item) transaction changes to `wallets` and
+    returns the resulting balances keyed by (walletId, userId)."""
+    client = InMemoryWalletsClient(wallets)
+    records = [stream_record(old, new, i) for i, (old, new) in enumerate(changes, start=1)]
+    result = balance_stream.apply_records(records, client)
+    if result["batchItemFailures"]:
+        raise RuntimeError(f"Replay failed at sequence {result['batchItemFailures'][0]['itemIdentifier']}")
+    return client.balances